@@ -0,0 +1,98 @@
+import json
+import os
+from datetime import datetime
+import pyarrow as pa
+import pyarrow.parquet as pq
+from . import models
+from .config import ARCHIVE_DIR, EXPORT_CHUNK_ROWS
+from .storage import open_async_repository, open_repository
+
+# Column layout of an archive's teams.parquet (with the standings at archive time) and matches.parquet
+TEAM_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("name", pa.string()),
+    ("registration_date", pa.string()),
+    ("group_number", pa.int32()),
+    ("match_points", pa.int32()),
+    ("goals_scored", pa.int32()),
+    ("alternate_points", pa.int32()),
+])
+MATCH_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("team_a", pa.string()),
+    ("team_b", pa.string()),
+    ("goals_a", pa.int32()),
+    ("goals_b", pa.int32()),
+])
+
+def championship_info(championship: models.Championship):
+    return {
+        "id": championship.id,
+        "name": championship.name,
+        "group_count": championship.group_count,
+        "group_capacity": championship.group_capacity,
+        "rules": championship.rules._asdict(),
+        "version": championship.version,
+    }
+
+# Snapshot a championship into a new archive directory holding teams.parquet and matches.parquet.
+# Rows are written one chunk at a time; the championship details are kept in the files' metadata.
+# With clear=True the championship is then cleared in the same write transaction, so no write can land
+# between the snapshot and the delete. Runs on its own repository and returns the directory.
+def write_archive(championship_id: int, clear: bool = False):
+    with open_repository() as repo:
+        if clear:
+            repo.lock_writes(championship_id)
+        championship = repo.get_championship(championship_id)
+        archived_at = datetime.now()
+        metadata = {"championship": json.dumps({**championship_info(championship), "archived_at": archived_at.isoformat(timespec="seconds")})}
+        directory = os.path.join(ARCHIVE_DIR, f"championship-{championship.id}-v{championship.version}-{archived_at:%Y%m%dT%H%M%S}")
+        os.makedirs(directory, exist_ok=True)
+
+        for name, schema in (("teams", TEAM_SCHEMA), ("matches", MATCH_SCHEMA)):
+            schema = schema.with_metadata(metadata)
+            with pq.ParquetWriter(os.path.join(directory, f"{name}.parquet"), schema, compression="zstd") as writer:
+                for rows in repo.export_rows(name, championship.id, EXPORT_CHUNK_ROWS):
+                    writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+        if clear:
+            repo.clear_championship(championship.id)
+    return directory
+
+def _line(record):
+    return (json.dumps(record) + "\n").encode()
+
+# Stream a championship as JSON lines: one championship record, then its teams, then its matches.
+# Rows are read one chunk at a time (through a server-side cursor on SQL), on a repository owned by the stream.
+async def export_lines(championship: models.Championship):
+    yield _line({"type": "championship", **championship_info(championship)})
+    async with open_async_repository() as repo:
+        for record_type, kind in (("team", "teams"), ("match", "matches")):
+            async for rows in repo.stream_rows(kind, championship.id, EXPORT_CHUNK_ROWS):
+                yield b"".join(_line({"type": record_type, **row}) for row in rows)
+
+# Parse a streamed JSON-lines body into chunks of up to `size` (line number, record) pairs.
+# A line that is not a JSON object comes through as (line number, None).
+async def read_records(stream, size: int):
+    buffer, chunk, number = b"", [], 0
+
+    def parse(line):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return None
+        return record if isinstance(record, dict) else None
+
+    async for data in stream:
+        buffer += data
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            number += 1
+            if line.strip():
+                chunk.append((number, parse(line)))
+            if len(chunk) == size:
+                yield chunk
+                chunk = []
+    if buffer.strip():
+        chunk.append((number + 1, parse(buffer)))
+    if chunk:
+        yield chunk
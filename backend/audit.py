@@ -0,0 +1,197 @@
+import atexit
+import bisect
+import fcntl
+import glob
+import json
+import logging
+import os
+import queue
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from .config import AUDIT_LOG_DIR, AUDIT_LOG_MAX_BYTES, AUDIT_LOG_BACKUP_COUNT
+
+# Every Nth record of a segment is remembered with its byte offset, so reads seek instead of scanning
+INDEX_STRIDE = 64
+
+# One JSON-lines file of the audit log, holding the records from first_seq onwards
+class Segment:
+    def __init__(self, path, first_seq):
+        self.path = path
+        self.first_seq = first_seq
+        self.index_seqs = []  # seq of every INDEX_STRIDE-th record
+        self.index_offsets = []  # byte offset of that record
+        self.count = 0
+        self.size = 0
+
+    def remember(self, seq, offset, length):
+        if self.count % INDEX_STRIDE == 0:
+            self.index_seqs.append(seq)
+            self.index_offsets.append(offset)
+        self.count += 1
+        self.size = offset + length
+
+    # Byte offset to start reading from to find the first record after `seq`
+    def offset_after(self, seq):
+        position = bisect.bisect_right(self.index_seqs, seq + 1) - 1
+        return self.index_offsets[position] if position >= 0 else 0
+
+# Writes audit records as numbered JSON lines into size-rotated segment files.
+# Runs on the QueueListener thread, so request handlers never wait on the disk. Several backend worker
+# processes can share the directory: writes hold an exclusive lock on a lock file and first catch up
+# with whatever the other workers appended, so sequence numbers and offsets stay unique and exact.
+class JsonLinesHandler(logging.Handler):
+    def __init__(self, directory, max_bytes, backup_count, basename="data_change_log"):
+        super().__init__()
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.basename = basename
+        self.segments = []
+        self.last_seq = 0
+        self.stream = None
+        os.makedirs(directory, exist_ok=True)
+        self.lock_file = open(os.path.join(directory, f"{basename}.lock"), "a")
+        self._sync()
+
+    def _segment_path(self, first_seq):
+        return os.path.join(self.directory, f"{self.basename}.{first_seq:012d}.jsonl")
+
+    # Exclusive lock across processes writing to the same directory
+    @contextmanager
+    def _file_lock(self):
+        fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+
+    # Bring the offset index and the last sequence number up to date with the segments on disk,
+    # indexing only the records appended (by any process) since the last look
+    def _sync(self):
+        known = {segment.path: segment for segment in self.segments}
+        segments = []
+        for path in sorted(glob.glob(os.path.join(self.directory, f"{self.basename}.*.jsonl"))):
+            segment = known.get(path) or Segment(path, int(path.rsplit(".", 2)[-2]))
+            try:
+                if os.path.getsize(path) > segment.size:
+                    self._index(segment)
+            except FileNotFoundError:
+                continue  # rotated away by another process
+            segments.append(segment)
+        self.segments = segments
+
+    def _index(self, segment):
+        with open(segment.path, "rb") as f:
+            f.seek(segment.size)
+            offset = segment.size
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # a record still being written
+                seq = json.loads(line)["seq"]
+                segment.remember(seq, offset, len(line))
+                self.last_seq = max(self.last_seq, seq)
+                offset += len(line)
+
+    def _open_segment(self, first_seq):
+        if self.stream is not None:
+            self.stream.close()
+        self.segments.append(Segment(self._segment_path(first_seq), first_seq))
+        self.stream = open(self.segments[-1].path, "ab")
+
+        # Keep the newest backup_count segments besides the one being written
+        while len(self.segments) > self.backup_count + 1:
+            os.remove(self.segments.pop(0).path)
+
+    def emit(self, record):
+        try:
+            with self.lock, self._file_lock():
+                self._sync()
+                seq = self.last_seq + 1
+                line = (json.dumps({"seq": seq, **record.audit}) + "\n").encode()
+
+                if not self.segments or self.segments[-1].size + len(line) > self.max_bytes:
+                    self._open_segment(seq)
+                elif self.stream is None or self.stream.name != self.segments[-1].path:
+                    # Another process may have started the current segment
+                    if self.stream is not None:
+                        self.stream.close()
+                    self.stream = open(self.segments[-1].path, "ab")
+
+                segment = self.segments[-1]
+                self.stream.write(line)
+                self.stream.flush()
+                segment.remember(seq, segment.size, len(line))
+                self.last_seq = seq
+        except Exception:
+            self.handleError(record)
+
+    # Pick up what other processes wrote since this one last looked
+    def refresh(self):
+        with self.lock:
+            self._sync()
+
+    # Read up to `limit` records with a sequence number greater than after_seq (call refresh first
+    # to see other processes' records)
+    def read(self, after_seq, limit):
+        with self.lock:
+            segments = list(self.segments)
+
+        # The segment holding after_seq + 1 is the last one starting at or before it
+        start = max(bisect.bisect_right([s.first_seq for s in segments], after_seq + 1) - 1, 0)
+        entries = []
+        for segment in segments[start:]:
+            try:
+                f = open(segment.path, "rb")
+            except FileNotFoundError:
+                continue  # rotated away since the segment list was copied
+            with f:
+                f.seek(segment.offset_after(after_seq))
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # a record still being written
+                    entry = json.loads(line)
+                    if entry["seq"] > after_seq:
+                        entries.append(entry)
+                        if len(entries) == limit:
+                            return entries
+        return entries
+
+    def close(self):
+        with self.lock:
+            if self.stream is not None:
+                self.stream.close()
+                self.stream = None
+            self.lock_file.close()
+        super().close()
+
+# Request handlers only enqueue records; the listener thread writes them
+handler = JsonLinesHandler(AUDIT_LOG_DIR, AUDIT_LOG_MAX_BYTES, AUDIT_LOG_BACKUP_COUNT)
+log_queue = queue.SimpleQueue()
+listener = QueueListener(log_queue, handler)
+listener.start()
+atexit.register(listener.stop)
+
+logger = logging.getLogger("championship.audit")
+logger.setLevel(logging.INFO)
+logger.propagate = False
+logger.addHandler(QueueHandler(log_queue))
+
+# Record one data change
+def record(action, item_type, item_name, details, championship=None):
+    logger.info("%s %s: %s - %s", action, item_type, item_name, details, extra={"audit": {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "action": action,
+        "item_type": item_type,
+        "item_name": item_name,
+        "details": details,
+        "championship_id": championship.id if championship is not None else None,
+        "championship": championship.name if championship is not None else None,
+    }})
+
+# Read the records after after_seq, or the latest `limit` records when after_seq is None
+def read(after_seq, limit):
+    handler.refresh()
+    if after_seq is None:
+        after_seq = max(handler.last_seq - limit, 0)
+    return handler.read(after_seq, limit), handler.last_seq
@@ -0,0 +1,34 @@
+import asyncio
+
+# Fans one computed rankings payload out to every open /rankings/stream of a championship.
+# Each subscriber keeps only the newest payload, so a slow screen skips versions instead of queueing them.
+class RankingsBroadcaster:
+    def __init__(self):
+        self.subscribers = {}
+
+    def subscribe(self, championship_id: int):
+        queue = asyncio.Queue(maxsize=1)
+        self.subscribers.setdefault(championship_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, championship_id: int, queue):
+        subscribers = self.subscribers.get(championship_id)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self.subscribers[championship_id]
+
+    def has_subscribers(self, championship_id: int):
+        return bool(self.subscribers.get(championship_id))
+
+    def publish(self, championship_id: int, version: int, body: bytes):
+        for queue in self.subscribers.get(championship_id, ()):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait((version, body))
+
+broadcaster = RankingsBroadcaster()
+
+# Format one Server-Sent Event carrying a rankings payload
+def sse_event(version: int, body: bytes):
+    return b"id: %d\nevent: rankings\ndata: %s\n\n" % (version, body)
@@ -0,0 +1,32 @@
+import gzip
+from .config import COMPRESS_MIN_BYTES, GZIP_LEVEL, BROTLI_QUALITY
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; without it responses are only gzip-compressed
+    brotli = None
+
+# Content codings this server can produce, most preferred first
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+# Pick the preferred coding the client accepts from an Accept-Encoding header, or None for identity
+def choose_encoding(accept_encoding):
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(coding.strip().lower())
+    for encoding in ENCODINGS:
+        if encoding in accepted or "*" in accepted:
+            return encoding
+    return None
+
+# Compress a body with the chosen coding when it is large enough to be worth it.
+# Returns (body, coding actually applied or None).
+def compress(body: bytes, encoding):
+    if encoding is None or len(body) < COMPRESS_MIN_BYTES:
+        return body, None
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY), "br"
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0), "gzip"
@@ -1 +1,51 @@
-DATABASE_URL = "sqlite:///./database.db"
+import os
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./database.db")
+# Same database through the aiosqlite driver, used by the request handlers
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1))
+
+# SQLite PRAGMAs applied to every new connection
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")  # OFF, NORMAL, FULL or EXTRA
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "20000"))
+
+# Connection pool sizing
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# Audit log of data changes: JSON-lines segments rotated by size
+AUDIT_LOG_DIR = os.getenv("AUDIT_LOG_DIR", ".")
+AUDIT_LOG_MAX_BYTES = int(os.getenv("AUDIT_LOG_MAX_BYTES", str(1024 * 1024)))
+AUDIT_LOG_BACKUP_COUNT = int(os.getenv("AUDIT_LOG_BACKUP_COUNT", "20"))
+
+# Qualification projections: simulations per process-pool task and number of worker processes
+PROJECTION_CHUNK_SIZE = int(os.getenv("PROJECTION_CHUNK_SIZE", "20000"))
+PROJECTION_WORKERS = int(os.getenv("PROJECTION_WORKERS", str(os.cpu_count() or 1)))
+
+# Log requests slower than this many milliseconds with their SQL trace (0 turns it off)
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "0"))
+SLOW_REQUEST_SQL_CHARS = int(os.getenv("SLOW_REQUEST_SQL_CHARS", "500"))  # statement text kept per trace line
+
+# Championship archives written by /clear/?archive=true, and the rows handled per chunk by /export and /import
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "./archives")
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "1000"))
+IMPORT_CHUNK_ROWS = int(os.getenv("IMPORT_CHUNK_ROWS", "1000"))
+
+# Match events between standings checkpoints, bounding the replay behind /rankings/?as_of=
+STANDINGS_CHECKPOINT_EVERY = int(os.getenv("STANDINGS_CHECKPOINT_EVERY", "100"))
+
+# Opt-in single writer: /teams/ and /matches/ additions are queued and committed in groups of up to
+# WRITE_QUEUE_MAX_BATCH rows, optionally waiting WRITE_QUEUE_WAIT_MS for a batch to fill
+WRITE_QUEUE = os.getenv("WRITE_QUEUE", "false").lower() in ("1", "true", "yes")
+WRITE_QUEUE_MAX_BATCH = int(os.getenv("WRITE_QUEUE_MAX_BATCH", "100"))
+WRITE_QUEUE_WAIT_MS = float(os.getenv("WRITE_QUEUE_WAIT_MS", "0"))
+
+# Storage backend: "sqlite" (the database above) or "memory" (process-local and lost on restart)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite")
+
+# Response compression: bodies from this size up are gzip- or brotli-encoded when the client accepts it
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1000"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
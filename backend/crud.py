@@ -1,36 +1,567 @@
-from sqlalchemy.orm import Session
+import json
+from sqlalchemy import case, func, literal_column, select, text, union_all, update
+from sqlalchemy.orm import Session, aliased
 from . import models, schemas
+from .config import STANDINGS_CHECKPOINT_EVERY
+from .ranking import registration_key, add_match_totals, compile_rules, dump_rules, load_rules
 
-# Create a new team
-def create_team(db: Session, team: schemas.TeamCreate):
-    db_team = models.Team(**team.dict())
+# Add each team's accumulated (match points, goals, alternate points) to its standing
+def _apply_totals(db: Session, totals):
+    for team_id, (match_points, goals, alternate_points) in totals.items():
+        db.query(models.Standing).filter(models.Standing.team_id == team_id).update({
+            models.Standing.match_points: models.Standing.match_points + match_points,
+            models.Standing.goals_scored: models.Standing.goals_scored + goals,
+            models.Standing.alternate_points: models.Standing.alternate_points + alternate_points,
+        }, synchronize_session=False)
+
+def _new_standing(db_team: models.Team):
+    return models.Standing(
+        team_id=db_team.id,
+        match_points=0,
+        goals_scored=0,
+        alternate_points=0,
+        registration_key=registration_key(db_team.registration_date),
+    )
+
+# Event recording a match's current result, and the one it replaces for updates
+def _match_event(db_match: models.Match, **previous):
+    return models.MatchEvent(
+        championship_id=db_match.championship_id,
+        match_id=db_match.id,
+        team_a_id=db_match.team_a_id,
+        team_b_id=db_match.team_b_id,
+        goals_a=db_match.goals_a,
+        goals_b=db_match.goals_b,
+        **previous,
+    )
+
+# Append match events, checkpointing the championship's standings once STANDINGS_CHECKPOINT_EVERY
+# events have built up since the last checkpoint. Runs after the standings are updated.
+def _record_match_events(db: Session, championship_id: int, events):
+    db.add_all(events)
+    db.flush()
+    last_checkpoint = db.query(func.max(models.StandingsCheckpoint.event_seq)).filter(
+        models.StandingsCheckpoint.championship_id == championship_id
+    ).scalar() or 0
+    pending = db.query(func.count(models.MatchEvent.seq)).filter(
+        models.MatchEvent.championship_id == championship_id, models.MatchEvent.seq > last_checkpoint
+    ).scalar()
+    if pending >= STANDINGS_CHECKPOINT_EVERY:
+        standings = (
+            db.query(models.Standing.team_id, models.Standing.match_points, models.Standing.goals_scored, models.Standing.alternate_points)
+            .join(models.Team, models.Team.id == models.Standing.team_id)
+            .filter(models.Team.championship_id == championship_id)
+        )
+        db.add(models.StandingsCheckpoint(
+            championship_id=championship_id,
+            event_seq=max(event.seq for event in events),
+            totals=json.dumps({team_id: [match_points, goals, alternate_points] for team_id, match_points, goals, alternate_points in standings}),
+        ))
+
+# Change feed entries for teams and matches as written (op "insert" or "update")
+def _team_change(championship_id: int, op: str, team_id: int, team):
+    row = {"id": team_id, "name": team.name, "registration_date": team.registration_date, "group_number": team.group_number}
+    return models.Change(championship_id=championship_id, kind="team", op=op, row_id=team_id, row=json.dumps(row))
+
+def _match_change(op: str, db_match: models.Match, team_a: models.Team, team_b: models.Team):
+    row = {
+        "id": db_match.id, "team_a_id": team_a.id, "team_b_id": team_b.id, "team_a": team_a.name, "team_b": team_b.name,
+        "goals_a": db_match.goals_a, "goals_b": db_match.goals_b,
+    }
+    return models.Change(championship_id=db_match.championship_id, kind="match", op=op, row_id=db_match.id, row=json.dumps(row))
+
+# Create a new championship
+def create_championship(db: Session, championship: schemas.ChampionshipCreate):
+    db_championship = models.Championship(
+        **championship.dict(exclude={"rules"}), rules_json=dump_rules(championship.rules), archived=False, version=0
+    )
+    db.add(db_championship)
+    db.commit()
+    db.refresh(db_championship)
+    return db_championship
+
+# Get a specific championship by id
+def get_championship(db: Session, championship_id: int):
+    return db.query(models.Championship).filter(models.Championship.id == championship_id).first()
+
+# Get a championship's ranking rules
+def get_rules(db: Session, championship_id: int):
+    return load_rules(db.query(models.Championship.rules_json).filter(models.Championship.id == championship_id).scalar())
+
+# Read a championship's data version from the database, not from a championship already in the session
+def get_championship_version(db: Session, championship_id: int):
+    return db.query(models.Championship.version).filter(models.Championship.id == championship_id).scalar()
+
+# Get all championships
+def get_championships(db: Session):
+    return db.query(models.Championship).order_by(models.Championship.id).all()
+
+# Mark a championship read-only; its rows stay in place and queryable
+def archive_championship(db: Session, db_championship: models.Championship):
+    db_championship.archived = True
+    db_championship.version += 1
+    db.commit()
+    db.refresh(db_championship)
+    return db_championship
+
+# Bump the championship data version as part of the current transaction, returning the new version.
+# The write lock is held from here to the commit, so that is the version the commit publishes.
+def bump_version(db: Session, championship_id: int):
+    return db.execute(
+        update(models.Championship)
+        .where(models.Championship.id == championship_id)
+        .values(version=models.Championship.version + 1)
+        .returning(models.Championship.version)
+    ).scalar_one()
+
+# Create a new team, returning it and the championship version committed
+def create_team(db: Session, championship_id: int, team: schemas.TeamCreate):
+    db_team = models.Team(**team.dict(), championship_id=championship_id)
     db.add(db_team)
+    db.flush()
+    db.add(_new_standing(db_team))
+    db.add(_team_change(championship_id, "insert", db_team.id, db_team))
+    version = bump_version(db, championship_id)
+    db.commit()
+    return db_team, version
+
+# Create several teams with a single commit, returning them and the championship version committed
+def create_teams(db: Session, championship_id: int, teams):
+    db_teams = [models.Team(**team.dict(), championship_id=championship_id) for team in teams]
+    db.add_all(db_teams)
+    db.flush()
+    db.add_all([_new_standing(db_team) for db_team in db_teams])
+    db.add_all([_team_change(championship_id, "insert", db_team.id, db_team) for db_team in db_teams])
+    version = bump_version(db, championship_id)
     db.commit()
-    db.refresh(db_team)
-    return db_team
+    return db_teams, version
 
-# Create a new match
-def create_match(db: Session, match: schemas.MatchCreate):
-    db_match = models.Match(**match.dict())
-    db.add(db_match)
+# Update a team's details and its standing row by id; matches reference the team by id.
+# Returns the championship version committed.
+def update_team(db: Session, championship_id: int, team_id: int, team: schemas.TeamCreate):
+    db.query(models.Team).filter(models.Team.id == team_id).update({
+        models.Team.name: team.name,
+        models.Team.registration_date: team.registration_date,
+        models.Team.group_number: team.group_number,
+    })
+    db.query(models.Standing).filter(models.Standing.team_id == team_id).update(
+        {"registration_key": registration_key(team.registration_date)}
+    )
+    db.add(_team_change(championship_id, "update", team_id, team))
+    version = bump_version(db, championship_id)
     db.commit()
-    db.refresh(db_match)
-    return db_match
+    return version
+
+# Create a new match between two resolved teams, returning it and the championship version committed
+def create_match(db: Session, championship_id: int, match: schemas.MatchCreate, team_a: models.Team, team_b: models.Team):
+    db_matches, version = create_matches(db, championship_id, [(match, team_a, team_b)])
+    return db_matches[0], version
 
-# Get all teams in a specific group
-def get_teams_by_group(db: Session, group_number: int):
-    return db.query(models.Team).filter(models.Team.group_number == group_number).all()
+# Create several (match, team_a, team_b) entries with a single commit and one standings update per team.
+# The unique pair index rejects a repeated pairing with an IntegrityError. Returns the matches and the
+# championship version committed.
+def create_matches(db: Session, championship_id: int, entries):
+    db_matches, totals, rules = [], {}, get_rules(db, championship_id)
+    for match, team_a, team_b in entries:
+        db_match = models.Match(championship_id=championship_id, goals_a=match.goals_a, goals_b=match.goals_b)
+        db_match.set_teams(team_a.id, team_b.id)
+        db_matches.append(db_match)
+        add_match_totals(totals, team_a.id, team_b.id, match.goals_a, match.goals_b, rules)
+    db.add_all(db_matches)
+    db.flush()
+    _apply_totals(db, totals)
+    _record_match_events(db, championship_id, [_match_event(db_match) for db_match in db_matches])
+    db.add_all([_match_change("insert", db_match, team_a, team_b) for db_match, (_, team_a, team_b) in zip(db_matches, entries)])
+    version = bump_version(db, championship_id)
+    db.commit()
+    return db_matches, version
+
+# Update a match, swapping its old contribution to the standings for the new one.
+# Returns the match and the championship version committed.
+def update_match(db: Session, db_match: models.Match, match: schemas.MatchCreate, team_a: models.Team, team_b: models.Team):
+    totals, rules = {}, get_rules(db, db_match.championship_id)
+    add_match_totals(totals, db_match.team_a_id, db_match.team_b_id, db_match.goals_a, db_match.goals_b, rules, sign=-1)
+    add_match_totals(totals, team_a.id, team_b.id, match.goals_a, match.goals_b, rules)
+    _apply_totals(db, totals)
+    previous = {
+        "prev_team_a_id": db_match.team_a_id,
+        "prev_team_b_id": db_match.team_b_id,
+        "prev_goals_a": db_match.goals_a,
+        "prev_goals_b": db_match.goals_b,
+    }
+    db_match.set_teams(team_a.id, team_b.id)
+    db_match.goals_a = match.goals_a
+    db_match.goals_b = match.goals_b
+    _record_match_events(db, db_match.championship_id, [_match_event(db_match, **previous)])
+    db.add(_match_change("update", db_match, team_a, team_b))
+    version = bump_version(db, db_match.championship_id)
+    db.commit()
+    return db_match, version
 
-# Get all matches
-def get_all_matches(db: Session):
-    return db.query(models.Match).all()
+# Get a specific match by id
+def get_match(db: Session, championship_id: int, match_id: int):
+    return db.query(models.Match).filter(
+        models.Match.championship_id == championship_id, models.Match.id == match_id
+    ).first()
+
+# Get all teams of a championship
+def get_teams(db: Session, championship_id: int):
+    return db.query(models.Team).filter(models.Team.championship_id == championship_id).all()
+
+# LIKE pattern for names containing text, with the LIKE wildcards in it matched literally (escape "\\")
+def _contains(text: str):
+    return "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
 
 # Get a specific team by name
-def get_team(db: Session, team_name: str):
-    return db.query(models.Team).filter(models.Team.name == team_name).first()
+def get_team(db: Session, championship_id: int, team_name: str):
+    return db.query(models.Team).filter(
+        models.Team.championship_id == championship_id, models.Team.name == team_name
+    ).first()
+
+# Get the (id, name, group_number, registration_date) of every team of a championship
+def get_team_details(db: Session, championship_id: int):
+    rows = db.query(models.Team.id, models.Team.name, models.Team.group_number, models.Team.registration_date).filter(
+        models.Team.championship_id == championship_id
+    )
+    return [tuple(row) for row in rows]
+
+# Get one keyset page of teams (id > after_id), selecting only the given columns
+def list_teams(db: Session, championship_id: int, columns, after_id: int = 0, limit: int = 100,
+               group_number: int = None, name: str = None):
+    query = db.query(*[getattr(models.Team, column) for column in columns]).filter(
+        models.Team.championship_id == championship_id, models.Team.id > after_id
+    )
+    if group_number is not None:
+        query = query.filter(models.Team.group_number == group_number)
+    if name:
+        query = query.filter(models.Team.name.ilike(_contains(name), escape="\\"))
+    return query.order_by(models.Team.id).limit(limit).all()
+
+# Whether the trigram index over team names exists (see migrations._add_team_search)
+_team_search_index = None
+
+def _has_team_search_index(db: Session):
+    global _team_search_index
+    if _team_search_index is None:
+        _team_search_index = db.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'teams_fts'")).first() is not None
+    return _team_search_index
+
+# Teams whose name contains `query` (case-insensitive) through the trigram index. Queries shorter than
+# a trigram, or databases without the index, match name prefixes case-insensitively through the lower(name) index.
+def search_teams(db: Session, championship_id: int, query: str, limit: int = 20):
+    teams = db.query(models.Team).filter(models.Team.championship_id == championship_id)
+    if len(query) >= 3 and _has_team_search_index(db):
+        matching = select(literal_column("rowid")).select_from(text("teams_fts")).where(text("teams_fts MATCH :phrase"))
+        phrase = '"' + query.replace('"', '""') + '"'
+        teams = teams.filter(models.Team.id.in_(matching)).params(phrase=phrase)
+    else:
+        prefix, name = query.lower(), func.lower(models.Team.name)
+        teams = teams.filter(name >= prefix, name < prefix + "\U0010ffff")
+    return teams.order_by(models.Team.id).limit(limit).all()
+
+# Every match a team played. One lookup per side keeps both (championship, team) indexes in use,
+# where an OR of the two sides would only narrow by championship.
+def get_team_matches(db: Session, championship_id: int, team_id: int):
+    as_team_a = select(models.Match.id).where(models.Match.championship_id == championship_id, models.Match.team_a_id == team_id)
+    as_team_b = select(models.Match.id).where(models.Match.championship_id == championship_id, models.Match.team_b_id == team_id)
+    return (
+        db.query(models.Match)
+        .filter(models.Match.id.in_(as_team_a.union_all(as_team_b)))
+        .order_by(models.Match.id)
+        .all()
+    )
+
+# Get one keyset page of matches (id > after_id), selecting only the given columns
+def list_matches(db: Session, championship_id: int, columns, after_id: int = 0, limit: int = 100,
+                 group_number: int = None, team: str = None, goals_a: int = None, goals_b: int = None):
+    team_a, team_b = aliased(models.Team), aliased(models.Team)
+    selectable = {
+        "id": models.Match.id,
+        "team_a": team_a.name.label("team_a"),
+        "team_b": team_b.name.label("team_b"),
+        "goals_a": models.Match.goals_a,
+        "goals_b": models.Match.goals_b,
+    }
+    query = (
+        db.query(*[selectable[column] for column in columns])
+        .select_from(models.Match)
+        .join(team_a, team_a.id == models.Match.team_a_id)
+        .join(team_b, team_b.id == models.Match.team_b_id)
+        .filter(models.Match.championship_id == championship_id, models.Match.id > after_id)
+    )
+    if group_number is not None:
+        query = query.filter(team_a.group_number == group_number)
+    if team:
+        pattern = _contains(team)
+        query = query.filter(team_a.name.ilike(pattern, escape="\\") | team_b.name.ilike(pattern, escape="\\"))
+    if goals_a is not None:
+        query = query.filter(models.Match.goals_a == goals_a)
+    if goals_b is not None:
+        query = query.filter(models.Match.goals_b == goals_b)
+    return query.order_by(models.Match.id).limit(limit).all()
+
+# Statement selecting every team of a championship with its standing, for streaming exports
+def export_teams_statement(championship_id: int):
+    return (
+        select(
+            models.Team.id, models.Team.name, models.Team.registration_date, models.Team.group_number,
+            models.Standing.match_points, models.Standing.goals_scored, models.Standing.alternate_points,
+        )
+        .join(models.Standing, models.Standing.team_id == models.Team.id)
+        .where(models.Team.championship_id == championship_id)
+        .order_by(models.Team.id)
+    )
+
+# Statement selecting every match of a championship with its team names, for streaming exports
+def export_matches_statement(championship_id: int):
+    team_a, team_b = aliased(models.Team), aliased(models.Team)
+    return (
+        select(models.Match.id, team_a.name.label("team_a"), team_b.name.label("team_b"), models.Match.goals_a, models.Match.goals_b)
+        .join(team_a, team_a.id == models.Match.team_a_id)
+        .join(team_b, team_b.id == models.Match.team_b_id)
+        .where(models.Match.championship_id == championship_id)
+        .order_by(models.Match.id)
+    )
+
+# Get every match of a championship as plain (id, team_a, team_b, goals_a, goals_b, team_a_id, team_b_id) rows,
+# read fresh from the database rather than through the session's loaded objects
+def get_match_rows(db: Session, championship_id: int):
+    team_a, team_b = aliased(models.Team), aliased(models.Team)
+    return db.execute(
+        select(
+            models.Match.id, team_a.name.label("team_a"), team_b.name.label("team_b"), models.Match.goals_a, models.Match.goals_b,
+            models.Match.team_a_id, models.Match.team_b_id,
+        )
+        .join(team_a, team_a.id == models.Match.team_a_id)
+        .join(team_b, team_b.id == models.Match.team_b_id)
+        .where(models.Match.championship_id == championship_id)
+        .order_by(models.Match.id)
+    ).all()
+
+# Get every team of a championship with its standing and position in its group, ordered by group, then
+# position. SQLite ranks them with a window function over the standings, ordered by the ruleset's compiled
+# criteria; head_to_head is left to ranking.apply_head_to_head, which only reorders tied teams.
+def get_ranked_standings(db: Session, championship_id: int, rules):
+    compiled = compile_rules(rules)
+    columns = {"id": models.Team.id, **{column.name: column for column in models.Standing.__table__.columns}}
+    position = func.row_number().over(
+        partition_by=models.Team.group_number,
+        order_by=[
+            columns[attribute].desc() if higher else columns[attribute]
+            for attribute, higher in compiled.columns_before + compiled.columns_after + (("id", False),)
+        ],
+    )
+    ranked = (
+        select(
+            models.Team.id, models.Team.name, models.Team.group_number, models.Team.registration_date,
+            models.Standing.match_points, models.Standing.goals_scored, models.Standing.alternate_points,
+            models.Standing.registration_key, position.label("position"),
+        )
+        .join(models.Standing, models.Standing.team_id == models.Team.id)
+        .where(models.Team.championship_id == championship_id)
+        .subquery()
+    )
+    return db.execute(select(ranked).order_by(ranked.c.group_number, ranked.c.position)).all()
+
+# Get the (lower team id, higher team id) pairs that have already played in a championship
+def get_played_pairs(db: Session, championship_id: int):
+    rows = db.query(models.Match.pair_low_id, models.Match.pair_high_id).filter(models.Match.championship_id == championship_id)
+    return {(low, high) for low, high in rows}
+
+# Standings of a championship as they stood after event as_of: the nearest earlier checkpoint plus
+# the events after it. Teams are listed with their current details; those added later score zero.
+def get_standings_as_of(db: Session, championship_id: int, as_of: int):
+    rules = get_rules(db, championship_id)
+    checkpoint = (
+        db.query(models.StandingsCheckpoint)
+        .filter(models.StandingsCheckpoint.championship_id == championship_id, models.StandingsCheckpoint.event_seq <= as_of)
+        .order_by(models.StandingsCheckpoint.event_seq.desc())
+        .first()
+    )
+    totals = {int(team_id): total for team_id, total in json.loads(checkpoint.totals).items()} if checkpoint else {}
+
+    events = db.query(models.MatchEvent).filter(
+        models.MatchEvent.championship_id == championship_id,
+        models.MatchEvent.seq > (checkpoint.event_seq if checkpoint else 0),
+        models.MatchEvent.seq <= as_of,
+    ).order_by(models.MatchEvent.seq)
+    for event in events:
+        if event.prev_goals_a is not None:
+            add_match_totals(totals, event.prev_team_a_id, event.prev_team_b_id, event.prev_goals_a, event.prev_goals_b, rules, sign=-1)
+        add_match_totals(totals, event.team_a_id, event.team_b_id, event.goals_a, event.goals_b, rules)
+
+    rows = []
+    for team in get_teams(db, championship_id):
+        match_points, goals, alternate_points = totals.get(team.id, (0, 0, 0))
+        rows.append((team, models.Standing(
+            team_id=team.id,
+            match_points=match_points,
+            goals_scored=goals,
+            alternate_points=alternate_points,
+            registration_key=registration_key(team.registration_date),
+        )))
+    return rows
+
+# Every match of a championship as it stood after event as_of, as (id, team_a, team_b, goals_a, goals_b,
+# team_a_id, team_b_id) rows
+def get_matches_as_of(db: Session, championship_id: int, as_of: int):
+    latest = (
+        select(func.max(models.MatchEvent.seq).label("seq"))
+        .where(models.MatchEvent.championship_id == championship_id, models.MatchEvent.seq <= as_of)
+        .group_by(models.MatchEvent.match_id)
+        .subquery()
+    )
+    team_a, team_b = aliased(models.Team), aliased(models.Team)
+    return db.execute(
+        select(
+            models.MatchEvent.match_id, team_a.name, team_b.name, models.MatchEvent.goals_a, models.MatchEvent.goals_b,
+            models.MatchEvent.team_a_id, models.MatchEvent.team_b_id,
+        )
+        .join(latest, latest.c.seq == models.MatchEvent.seq)
+        .join(team_a, team_a.id == models.MatchEvent.team_a_id)
+        .join(team_b, team_b.id == models.MatchEvent.team_b_id)
+        .order_by(models.MatchEvent.match_id)
+    ).all()
+
+# Get one page of a championship's match events (seq > after_seq) with team names
+def list_match_events(db: Session, championship_id: int, after_seq: int = 0, limit: int = 100):
+    team_a, team_b = aliased(models.Team), aliased(models.Team)
+    return (
+        db.query(
+            models.MatchEvent.seq, models.MatchEvent.match_id,
+            team_a.name.label("team_a"), team_b.name.label("team_b"),
+            models.MatchEvent.goals_a, models.MatchEvent.goals_b,
+            models.MatchEvent.prev_goals_a, models.MatchEvent.prev_goals_b,
+        )
+        .join(team_a, team_a.id == models.MatchEvent.team_a_id)
+        .join(team_b, team_b.id == models.MatchEvent.team_b_id)
+        .filter(models.MatchEvent.championship_id == championship_id, models.MatchEvent.seq > after_seq)
+        .order_by(models.MatchEvent.seq)
+        .limit(limit)
+        .all()
+    )
+
+# One row per side of every match of the given championships: the team, its goals and the points the
+# result earns it under their ruleset
+def _match_sides(championship_ids, rules):
+    (win, draw, loss), (alt_win, alt_draw, alt_loss) = rules.points, rules.alternate_points
+    def side(team_id, goals, conceded):
+        return select(
+            team_id.label("team_id"),
+            goals.label("goals"),
+            case((goals > conceded, win), (goals == conceded, draw), else_=loss).label("match_points"),
+            case((goals > conceded, alt_win), (goals == conceded, alt_draw), else_=alt_loss).label("alternate_points"),
+        ).where(models.Match.championship_id.in_(championship_ids))
+    return union_all(
+        side(models.Match.team_a_id, models.Match.goals_a, models.Match.goals_b),
+        side(models.Match.team_b_id, models.Match.goals_b, models.Match.goals_a),
+    ).subquery()
+
+# Get up to `limit` changes of a championship after seq `since`, as (seq, kind, op, row) with the row decoded
+def list_changes(db: Session, championship_id: int, since: int = 0, limit: int = 100):
+    rows = (
+        db.query(models.Change.seq, models.Change.kind, models.Change.op, models.Change.row)
+        .filter(models.Change.championship_id == championship_id, models.Change.seq > since)
+        .order_by(models.Change.seq)
+        .limit(limit)
+    )
+    return [(seq, kind, op, json.loads(row) if row is not None else None) for seq, kind, op, row in rows]
+
+# (seq of the championship's last clear, seq of its newest change), 0 where there is none
+def get_change_bounds(db: Session, championship_id: int):
+    cleared, last = db.query(
+        func.max(case((models.Change.op == "clear", models.Change.seq))), func.max(models.Change.seq)
+    ).filter(models.Change.championship_id == championship_id).one()
+    return cleared or 0, last or 0
+
+# Drop every change superseded by a later change of the same row. Each row keeps its latest state in
+# the feed, so clients at any position still converge (changes are applied as upserts). Returns the count.
+def compact_changes(db: Session):
+    latest = select(func.max(models.Change.seq)).group_by(models.Change.championship_id, models.Change.kind, models.Change.row_id)
+    count = db.query(models.Change).filter(models.Change.seq.not_in(latest)).delete(synchronize_session=False)
+    db.commit()
+    return count
+
+# Recompute every team's standing from scratch out of the matches table, tallied inside SQLite
+# with a single UNION ALL + GROUP BY aggregate per distinct ruleset
+def compute_standings(db: Session):
+    by_rules = {}
+    for championship_id, rules_json in db.query(models.Championship.id, models.Championship.rules_json):
+        by_rules.setdefault(load_rules(rules_json), []).append(championship_id)
+
+    standings = {}
+    for rules, championship_ids in by_rules.items():
+        sides = _match_sides(championship_ids, rules)
+        totals = (
+            select(
+                sides.c.team_id,
+                func.sum(sides.c.match_points).label("match_points"),
+                func.sum(sides.c.goals).label("goals_scored"),
+                func.sum(sides.c.alternate_points).label("alternate_points"),
+            )
+            .group_by(sides.c.team_id)
+            .subquery()
+        )
+        rows = db.execute(
+            select(
+                models.Team.id, models.Team.registration_date,
+                func.coalesce(totals.c.match_points, 0), func.coalesce(totals.c.goals_scored, 0), func.coalesce(totals.c.alternate_points, 0),
+            )
+            .outerjoin(totals, totals.c.team_id == models.Team.id)
+            .where(models.Team.championship_id.in_(championship_ids))
+        )
+        for team_id, registration_date, match_points, goals, alternate_points in rows:
+            standings[team_id] = models.Standing(
+                team_id=team_id,
+                match_points=match_points,
+                goals_scored=goals,
+                alternate_points=alternate_points,
+                registration_key=registration_key(registration_date),
+            )
+    return standings
+
+# Compare the stored standings with a full recompute, returning the mismatching team ids
+def check_standings(db: Session):
+    expected = compute_standings(db)
+    stored = {standing.team_id: standing for standing in db.query(models.Standing).all()}
+    columns = ("match_points", "goals_scored", "alternate_points", "registration_key")
+
+    mismatches = []
+    for team_id in expected.keys() | stored.keys():
+        want, have = expected.get(team_id), stored.get(team_id)
+        if want is None or have is None or any(getattr(want, c) != getattr(have, c) for c in columns):
+            mismatches.append(team_id)
+    return sorted(mismatches)
+
+# Replace the stored standings with a full recompute from the matches table
+def rebuild_standings(db: Session):
+    standings = compute_standings(db)
+    db.query(models.Standing).delete()
+    db.add_all(standings.values())
+    db.query(models.Championship).update({models.Championship.version: models.Championship.version + 1})
+    db.commit()
+    return len(standings)
+
+# Build the standings table for databases created before it existed
+def ensure_standings(db: Session):
+    if db.query(models.Standing).count() != db.query(models.Team).count():
+        rebuild_standings(db)
+
+# Take the database write lock for the rest of the transaction, holding off every other writer until it commits
+def lock_writes(db: Session, championship_id: int):
+    db.execute(update(models.Championship).where(models.Championship.id == championship_id).values(version=models.Championship.version))
 
-# Clear all teams and matches from the database
-def clear_all_data(db: Session):
-    db.query(models.Team).delete()
-    db.query(models.Match).delete()
+# Clear one championship's teams, matches and standings through its indexed partition
+def clear_championship(db: Session, championship_id: int):
+    team_ids = db.query(models.Team.id).filter(models.Team.championship_id == championship_id)
+    db.query(models.Standing).filter(models.Standing.team_id.in_(team_ids.scalar_subquery())).delete(synchronize_session=False)
+    db.query(models.Match).filter(models.Match.championship_id == championship_id).delete(synchronize_session=False)
+    db.query(models.Team).filter(models.Team.championship_id == championship_id).delete(synchronize_session=False)
+    # The history refers to the deleted teams, so it goes with them
+    db.query(models.MatchEvent).filter(models.MatchEvent.championship_id == championship_id).delete(synchronize_session=False)
+    db.query(models.StandingsCheckpoint).filter(models.StandingsCheckpoint.championship_id == championship_id).delete(synchronize_session=False)
+    # Clients following the feed learn of the clear from the one change left in it
+    db.query(models.Change).filter(models.Change.championship_id == championship_id).delete(synchronize_session=False)
+    db.add(models.Change(championship_id=championship_id, kind="championship", op="clear"))
+    bump_version(db, championship_id)
     db.commit()
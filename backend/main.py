@@ -1,234 +1,751 @@
-from fastapi import FastAPI, Depends, HTTPException
-from sqlalchemy.orm import Session
-from . import models, schemas, crud
-from .database import engine, get_db
-from datetime import datetime
-import logging
-
-# Configure logging
-logging.basicConfig(filename="data_change_log.txt", level=logging.INFO, format="%(asctime)s - %(message)s")
-
-# Helper function to log changes
-def log_change(action, item_type, item_name, details):
-    log_message = f"{action} {item_type}: {item_name} - {details}"
-    logging.info(log_message)
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import ValidationError
+from . import models, schemas, crud, validation, migrations, audit, ranking, archives, compression
+from .broadcast import broadcaster, sse_event
+from .snapshot import Snapshot, snapshots
+from .metrics import MetricsMiddleware, registry
+from .writer import GroupCommitWriter
+from .config import COMPRESS_MIN_BYTES, IMPORT_CHUNK_ROWS, STORAGE_BACKEND, WRITE_QUEUE, WRITE_QUEUE_MAX_BATCH, WRITE_QUEUE_WAIT_MS
+from .database import engine, SessionLocal
+from .repository import ConflictError, Repository
+from .storage import get_repository
+from typing import List, Optional
+import asyncio
+import orjson
+import numpy as np
+
+# Helper function to log changes; records are queued and written off the request path
+def log_change(action, item_type, item_name, details, championship=None):
+    audit.record(action, item_type, item_name, details, championship)
     
-# Initialize the database tables
-models.Base.metadata.create_all(bind=engine)
+if STORAGE_BACKEND == "sqlite":
+    # Initialize the database tables and upgrade databases created by older versions
+    models.Base.metadata.create_all(bind=engine)
+    migrations.migrate(engine)
+
+    # Backfill the standings table for databases created before it existed
+    with SessionLocal() as db:
+        crud.ensure_standings(db)
 
 app = FastAPI()
+app.add_middleware(MetricsMiddleware)
+# Compress other large JSON responses (team and match pages, logs); /rankings/ compresses its own cached bodies
+app.add_middleware(GZipMiddleware, minimum_size=COMPRESS_MIN_BYTES)
+
+# Resolve the championship a request is scoped to (championship_id query parameter)
+async def get_championship(championship_id: int = 1, repo: Repository = Depends(get_repository)):
+    championship = await repo.run(repo.get_championship, championship_id)
+    if championship is None:
+        raise HTTPException(status_code=404, detail="Championship not found")
+    return championship
+
+# Same as get_championship, but rejects writes to archived championships
+async def get_writable_championship(championship: models.Championship = Depends(get_championship)):
+    if championship.archived:
+        raise HTTPException(status_code=409, detail=f"Championship '{championship.name}' is archived and read-only.")
+    return championship
+
+
+# List all championships
+@app.get("/championships/", response_model=List[schemas.Championship])
+async def list_championships(repo: Repository = Depends(get_repository)):
+    return await repo.run(repo.get_championships)
+
+
+# Start a new championship with its own group settings
+@app.post("/championships/", response_model=schemas.Championship)
+async def add_championship(championship: schemas.ChampionshipCreate, repo: Repository = Depends(get_repository)):
+    if championship.group_count < 1 or championship.group_capacity < 2:
+        raise HTTPException(status_code=400, detail="A championship needs at least 1 group of at least 2 teams.")
+    if championship.rules is not None:
+        validation.validate_rules(championship.rules)
+
+    created_championship = await repo.run(repo.create_championship, championship)
+
+    log_change("Added", "Championship", championship.name, f"{championship.group_count} groups of up to {championship.group_capacity} teams")
+
+    return created_championship
+
+
+# Archive a championship: its data is kept and stays readable, but no longer changes
+@app.post("/championships/{championship_id}/archive", response_model=schemas.Championship)
+async def archive_championship(championship_id: int, repo: Repository = Depends(get_repository)):
+    championship = await get_writable_championship(await get_championship(championship_id, repo))
+    archived = await repo.run(repo.archive_championship, championship)
+
+    log_change("Archived", "Championship", championship.name, "Championship data is now read-only")
+
+    return archived
+
 
 # Add a new team
 @app.post("/teams/", response_model=schemas.Team)
-def add_team(team: schemas.TeamCreate, db: Session = Depends(get_db)):
-    # Validate date format
-    try:
-        datetime.strptime(team.registration_date, "%d/%m")
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid date format. Expected DD/MM.")
-    
-    # Validate group number
-    if team.group_number not in [1, 2]:
-        raise HTTPException(status_code=400, detail="Group number must be 1 or 2.")
-    
-    # Check group capacity
-    group_count = db.query(models.Team).filter(models.Team.group_number == team.group_number).count()
-    if group_count >= 6:
-        raise HTTPException(status_code=400, detail=f"Group {team.group_number} already has 6 teams. No more teams can be added.")
+async def add_team(team: schemas.TeamCreate, championship: models.Championship = Depends(get_writable_championship), repo: Repository = Depends(get_repository)):
+    if WRITE_QUEUE:
+        # Hand the connection back while queued, so waiting requests never starve the writer
+        await repo.close()
+        created_team = await writer.submit(championship.id, team)
+    else:
+        # Validate against the in-memory index; the insert is the only database work
+        index = await repo.run(validation.get_index, repo, championship)
+        validation.validate_team(team, championship, index.group_counts[team.group_number], team.name in index.teams)
+        version = index.version
 
-    db_team = crud.get_team(db, team.name)
-    if db_team:
-        raise HTTPException(status_code=400, detail="Team already exists")
-    
-    created_team = crud.create_team(db, team)
+        try:
+            created_team, committed = await repo.run(repo.create_team, championship.id, team)
+        except ConflictError:
+            raise HTTPException(status_code=400, detail="Team already exists")
+        index.added_teams(version, committed, [created_team])
+        await swap_snapshot(repo, championship)
 
     # Log the change
-    log_change("Added", "Team", team.name, f"Group {team.group_number}, Registration Date {team.registration_date}")
+    log_change("Added", "Team", team.name, f"Group {team.group_number}, Registration Date {team.registration_date}", championship)
 
     return created_team
 
 
+# Validate a batch row by row against one snapshot, collecting what accept() returns for the accepted rows
+def validate_batch(rows, accept, atomic):
+    results, accepted = [], []
+    for index, row in enumerate(rows):
+        try:
+            entry = accept(row)
+        except HTTPException as e:
+            results.append(schemas.BulkRowResult(index=index, accepted=False, detail=e.detail))
+        else:
+            results.append(schemas.BulkRowResult(index=index, accepted=True, detail="OK"))
+            accepted.append(entry)
+
+    # In all-or-nothing mode one bad row rejects the whole batch
+    if atomic and len(accepted) != len(rows):
+        for result in results:
+            if result.accepted:
+                result.accepted = False
+                result.detail = "Not added: batch rejected"
+        accepted = []
+    return results, accepted
+
+
+# Add several teams in one transaction
+@app.post("/teams/bulk", response_model=schemas.BulkResult)
+async def add_teams_bulk(batch: schemas.TeamBulkCreate, championship: models.Championship = Depends(get_writable_championship), repo: Repository = Depends(get_repository)):
+    index = await repo.run(validation.get_index, repo, championship)
+    results, accepted = validate_batch(batch.teams, index.copy().accept_team, batch.atomic)
+    version = index.version
+
+    if accepted:
+        try:
+            created_teams, committed = await repo.run(repo.create_teams, championship.id, accepted)
+        except ConflictError:
+            raise HTTPException(status_code=409, detail="A team in the batch was added concurrently. Please retry.")
+        index.added_teams(version, committed, created_teams)
+        for team in accepted:
+            log_change("Added", "Team", team.name, f"Group {team.group_number}, Registration Date {team.registration_date}", championship)
+        await swap_snapshot(repo, championship)
+
+    return schemas.BulkResult(committed=bool(accepted), results=results)
+
+
+# Columns that can be requested through fields= on the list endpoints
+TEAM_FIELDS = ("id", "name", "registration_date", "group_number")
+MATCH_FIELDS = ("id", "team_a", "team_b", "goals_a", "goals_b")
+
+# Parse a comma-separated fields= projection; id is always included as the page cursor
+def parse_fields(fields, allowed):
+    if not fields:
+        return list(allowed)
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(allowed)}")
+    return ["id"] + [field for field in requested if field != "id"]
+
+# Build a keyset page from the selected rows
+def make_page(rows, limit):
+    items = [row._asdict() for row in rows]
+    next_after_id = items[-1]["id"] if len(items) == limit else None
+    return schemas.Page(items=items, next_after_id=next_after_id)
+
+
+# List teams, one keyset page at a time
+@app.get("/teams/", response_model=schemas.Page)
+async def list_teams(
+    after_id: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    fields: Optional[str] = None,
+    group_number: Optional[int] = None,
+    name: Optional[str] = None,
+    championship: models.Championship = Depends(get_championship),
+    repo: Repository = Depends(get_repository),
+):
+    columns = parse_fields(fields, TEAM_FIELDS)
+    rows = await repo.run(repo.list_teams, championship.id, columns, after_id, limit, group_number=group_number, name=name)
+    return make_page(rows, limit)
+
+
+# Search teams by any part of their name
+@app.get("/teams/search", response_model=List[schemas.Team])
+async def search_teams(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    championship: models.Championship = Depends(get_championship),
+    repo: Repository = Depends(get_repository),
+):
+    return await repo.run(repo.search_teams, championship.id, q, limit)
+
+
+# List every match a team played
+@app.get("/teams/{team_name}/matches", response_model=List[schemas.Match])
+async def list_team_matches(team_name: str, championship: models.Championship = Depends(get_championship), repo: Repository = Depends(get_repository)):
+    team = await repo.run(repo.get_team, championship.id, team_name)
+    if team is None:
+        raise HTTPException(status_code=404, detail="Team not found")
+    return await repo.run(repo.get_team_matches, championship.id, team.id)
+
+
 # Update a team's details
 @app.put("/teams/{team_name}", response_model=schemas.Team)
-def update_team(team_name: str, team: schemas.TeamCreate, db: Session = Depends(get_db)):
-    db_team = crud.get_team(db, team_name)
-    if db_team is None:
+async def update_team(team_name: str, team: schemas.TeamCreate, championship: models.Championship = Depends(get_writable_championship), repo: Repository = Depends(get_repository)):
+    index = await repo.run(validation.get_index, repo, championship)
+    old_team = index.teams.get(team_name)
+    if old_team is None:
         raise HTTPException(status_code=404, detail="Team not found")
-    
-    old_name = db_team.name
 
-    # Update the team details
-    db_team.name = team.name
-    db_team.registration_date = team.registration_date
-    db_team.group_number = team.group_number
-    db.commit()
-    db.refresh(db_team)
+    validation.validate_team_details(team, championship)
+
+    # Moving to another group needs room in that group
+    if team.group_number != old_team.group_number:
+        validation.validate_group_capacity(team.group_number, index.group_counts[team.group_number], championship)
+
+    if team.name != old_team.name and team.name in index.teams:
+        raise HTTPException(status_code=400, detail="Team already exists")
+    version = index.version
 
-    # Update team name in matches where it is referenced
-    db.query(models.Match).filter(models.Match.team_a == old_name).update({"team_a": team.name})
-    db.query(models.Match).filter(models.Match.team_b == old_name).update({"team_b": team.name})
-    db.commit()
+    # Update the team details and its standing; matches reference the team by id
+    try:
+        committed = await repo.run(repo.update_team, championship.id, old_team.id, team)
+    except ConflictError:
+        raise HTTPException(status_code=400, detail="Team already exists")
+    index.updated_team(version, committed, old_team, validation.IndexedTeam(old_team.id, team.name, team.group_number, team.registration_date))
 
     # Log the change
-    log_change("Updated", "Team", old_name, f"New Name: {team.name}, New Group: {team.group_number}")
+    log_change("Updated", "Team", old_team.name, f"New Name: {team.name}, New Group: {team.group_number}", championship)
+    await swap_snapshot(repo, championship)
+
+    return schemas.Team(id=old_team.id, championship_id=championship.id, **team.dict())
+
 
-    return db_team
+# List matches, one keyset page at a time
+@app.get("/matches/", response_model=schemas.Page)
+async def list_matches(
+    after_id: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    fields: Optional[str] = None,
+    group_number: Optional[int] = None,
+    team: Optional[str] = None,
+    goals_a: Optional[int] = None,
+    goals_b: Optional[int] = None,
+    championship: models.Championship = Depends(get_championship),
+    repo: Repository = Depends(get_repository),
+):
+    columns = parse_fields(fields, MATCH_FIELDS)
+    rows = await repo.run(repo.list_matches, championship.id, columns, after_id, limit, group_number=group_number, team=team, goals_a=goals_a, goals_b=goals_b)
+    return make_page(rows, limit)
 
 
 # Add a new match
 @app.post("/matches/", response_model=schemas.Match)
-def add_match(match: schemas.MatchCreate, db: Session = Depends(get_db)):
-    # Check if team_a and team_b are different
-    if match.team_a == match.team_b:
-        raise HTTPException(status_code=400, detail="Team A and Team B must be different.")
-    
-    # Check if team_a exists
-    db_team_a = crud.get_team(db, match.team_a)
-    if db_team_a is None:
-        raise HTTPException(status_code=400, detail=f"Team '{match.team_a}' not recognized")
-    
-    # Check if team_b exists
-    db_team_b = crud.get_team(db, match.team_b)
-    if db_team_b is None:
-        raise HTTPException(status_code=400, detail=f"Team '{match.team_b}' not recognized")
-    
-    # Ensure both teams are in the same group
-    if db_team_a.group_number != db_team_b.group_number:
-        raise HTTPException(status_code=400, detail=f"No cross-group matches allowed. Teams '{match.team_a}' and '{match.team_b}' are in different groups.")
-    
-    # Check if a match between team_a and team_b already exists (in either order)
-    existing_match = db.query(models.Match).filter(
-        ((models.Match.team_a == match.team_a) & (models.Match.team_b == match.team_b)) |
-        ((models.Match.team_a == match.team_b) & (models.Match.team_b == match.team_a))
-    ).first()
-    
-    if existing_match:
-        raise HTTPException(status_code=400, detail=f"A match between {match.team_a} and {match.team_b} already exists.")
-    
-    # Create the match
-    created_match = crud.create_match(db, match)
+async def add_match(match: schemas.MatchCreate, championship: models.Championship = Depends(get_writable_championship), repo: Repository = Depends(get_repository)):
+    if WRITE_QUEUE:
+        # Hand the connection back while queued, so waiting requests never starve the writer
+        await repo.close()
+        created_match = await writer.submit(championship.id, match)
+    else:
+        # Validate against the in-memory index; the insert is the only database work
+        index = await repo.run(validation.get_index, repo, championship)
+        team_a, team_b = index.check_match(match)
+        version = index.version
+
+        # Create the match; the unique pair index still rejects a match added concurrently (in either order)
+        try:
+            created_match, committed = await repo.run(repo.create_match, championship.id, match, team_a, team_b)
+        except ConflictError:
+            raise HTTPException(status_code=400, detail=f"A match between {match.team_a} and {match.team_b} already exists.")
+        index.added_pairs(version, committed, [validation.pair_of(team_a, team_b)])
+        await swap_snapshot(repo, championship)
 
     # Log the addition of the match
-    log_change("Added", "Match", f"{match.team_a} vs {match.team_b}", f"Score: {match.goals_a}-{match.goals_b}")
+    log_change("Added", "Match", f"{match.team_a} vs {match.team_b}", f"Score: {match.goals_a}-{match.goals_b}", championship)
 
-    return created_match
+    return schemas.Match(id=created_match.id, championship_id=championship.id, **match.dict())
+
+
+# Add several matches in one transaction
+@app.post("/matches/bulk", response_model=schemas.BulkResult)
+async def add_matches_bulk(batch: schemas.MatchBulkCreate, championship: models.Championship = Depends(get_writable_championship), repo: Repository = Depends(get_repository)):
+    index = await repo.run(validation.get_index, repo, championship)
+    results, accepted = validate_batch(batch.matches, index.copy().accept_match, batch.atomic)
+    version = index.version
+
+    if accepted:
+        try:
+            _, committed = await repo.run(repo.create_matches, championship.id, accepted)
+        except ConflictError:
+            raise HTTPException(status_code=409, detail="A match in the batch was added concurrently. Please retry.")
+        index.added_pairs(version, committed, [validation.pair_of(team_a, team_b) for _, team_a, team_b in accepted])
+        for match, _, _ in accepted:
+            log_change("Added", "Match", f"{match.team_a} vs {match.team_b}", f"Score: {match.goals_a}-{match.goals_b}", championship)
+        await swap_snapshot(repo, championship)
+
+    return schemas.BulkResult(committed=bool(accepted), results=results)
 
 
 # Update a match's details
 @app.put("/matches/{match_id}", response_model=schemas.Match)
-def update_match(match_id: int, match: schemas.MatchCreate, db: Session = Depends(get_db)):
-    db_match = db.query(models.Match).filter(models.Match.id == match_id).first()
+async def update_match(match_id: int, match: schemas.MatchCreate, championship: models.Championship = Depends(get_writable_championship), repo: Repository = Depends(get_repository)):
+    db_match = await repo.run(repo.get_match, championship.id, match_id)
     if db_match is None:
         raise HTTPException(status_code=404, detail="Match not found")
     
-    if match.goals_a < 0 or match.goals_b < 0:
-        raise HTTPException(status_code=400, detail="Goals cannot be negative")
-    
+    index = await repo.run(validation.get_index, repo, championship)
+    validation.validate_match_input(match)
+    team_a, team_b = index.teams.get(match.team_a), index.teams.get(match.team_b)
+    validation.validate_match(match, team_a, team_b)
+
+    # Re-entering the same pairing is fine; moving the match onto a pairing that already played is not
+    old_pair, new_pair = (db_match.pair_low_id, db_match.pair_high_id), validation.pair_of(team_a, team_b)
+    if new_pair != old_pair and new_pair in index.played:
+        raise HTTPException(status_code=400, detail=f"A match between {match.team_a} and {match.team_b} already exists.")
+    version = index.version
+
     # Log before updating the match
-    log_change("Updated", "Match", f"{db_match.team_a} vs {db_match.team_b}", f"Old Score: {db_match.goals_a}-{db_match.goals_b}")
+    log_change("Updated", "Match", f"{db_match.team_a} vs {db_match.team_b}", f"Old Score: {db_match.goals_a}-{db_match.goals_b}", championship)
 
-    # Update the match details
-    db_match.team_a = match.team_a
-    db_match.team_b = match.team_b
-    db_match.goals_a = match.goals_a
-    db_match.goals_b = match.goals_b
-    db.commit()
-    db.refresh(db_match)
+    # Update the match details and its contribution to the standings
+    try:
+        db_match, committed = await repo.run(repo.update_match, db_match, match, team_a, team_b)
+    except ConflictError:
+        raise HTTPException(status_code=400, detail=f"A match between {match.team_a} and {match.team_b} already exists.")
+    index.updated_pair(version, committed, old_pair, new_pair)
 
     # Log after updating the match
-    log_change("Updated", "Match", f"{match.team_a} vs {match.team_b}", f"New Score: {match.goals_a}-{match.goals_b}")
-
-    return db_match
-
-# Get rankings and top 4 teams
-@app.get("/rankings/")
-def get_rankings(db: Session = Depends(get_db)):
-    teams_group_1 = crud.get_teams_by_group(db, 1)
-    teams_group_2 = crud.get_teams_by_group(db, 2)
-    matches = crud.get_all_matches(db)
-
-    # Initialize ranking dictionary for each team
-    rankings = {team.name: {
-        "match_points": 0,
-        "goals_scored": 0,
-        "alternate_points": 0,
-        "registration_date": datetime.strptime(team.registration_date, "%d/%m"),  # Convert to datetime for comparison
-        "group_number": team.group_number
-    } for team in teams_group_1 + teams_group_2}
-
-    # Calculate match points, goals, and alternate points
-    for match in matches:
-        if match.goals_a > match.goals_b:  # Team A wins
-            rankings[match.team_a]["match_points"] += 3
-            rankings[match.team_a]["alternate_points"] += 5
-            rankings[match.team_b]["alternate_points"] += 1
-        elif match.goals_a < match.goals_b:  # Team B wins
-            rankings[match.team_b]["match_points"] += 3
-            rankings[match.team_b]["alternate_points"] += 5
-            rankings[match.team_a]["alternate_points"] += 1
-        else:  # Draw
-            rankings[match.team_a]["match_points"] += 1
-            rankings[match.team_b]["match_points"] += 1
-            rankings[match.team_a]["alternate_points"] += 3
-            rankings[match.team_b]["alternate_points"] += 3
-        
-        # Add goals scored
-        rankings[match.team_a]["goals_scored"] += match.goals_a
-        rankings[match.team_b]["goals_scored"] += match.goals_b
-
-    # Sort teams based on ranking criteria, with registration date as the last tiebreaker
-    sorted_teams_group_1 = sorted(teams_group_1, key=lambda team: (
-        -rankings[team.name]["match_points"],
-        -rankings[team.name]["goals_scored"],
-        -rankings[team.name]["alternate_points"],
-        rankings[team.name]["registration_date"]
-    ))
-
-    sorted_teams_group_2 = sorted(teams_group_2, key=lambda team: (
-        -rankings[team.name]["match_points"],
-        -rankings[team.name]["goals_scored"],
-        -rankings[team.name]["alternate_points"],
-        rankings[team.name]["registration_date"]
-    ))
-
-    # Get top 4 teams for each group based on correct tiebreaker
-    top_4_group_1 = sorted_teams_group_1[:4]
-    top_4_group_2 = sorted_teams_group_2[:4]
+    log_change("Updated", "Match", f"{match.team_a} vs {match.team_b}", f"New Score: {match.goals_a}-{match.goals_b}", championship)
+    await swap_snapshot(repo, championship)
+
+    return schemas.Match(id=db_match.id, championship_id=championship.id, **match.dict())
+
+# Compute rankings and the qualifying teams from ranked standings (ranking.RankedTeam rows, ordered by group,
+# then position) and (id, team_a, team_b, goals_a, goals_b, ...) matches. The top_4_group_<n> keys hold the
+# ruleset's top_n teams; they keep their name for existing clients.
+def format_rankings(ranked, matches, group_count: int, rules: ranking.Ruleset):
+    groups = ranking.group_ranked(ranked)
 
     # Format team rankings
     team_rankings = [
         {
             "team_name": team.name,
-            "match_points": rankings[team.name]["match_points"],
-            "goals_scored": rankings[team.name]["goals_scored"],
-            "alternate_points": rankings[team.name]["alternate_points"],
+            "match_points": team.match_points,
+            "goals_scored": team.goals_scored,
+            "alternate_points": team.alternate_points,
             "registration_date": team.registration_date,  # Keep as string for display
             "group_number": team.group_number
         }
-        for team in sorted_teams_group_1 + sorted_teams_group_2
+        for team in ranked
     ]
 
-    # Return rankings and matches, and send top 4 teams for both groups
-    return {
+    # Return rankings and matches, and send top 4 teams for every group
+    rankings = {
         "rankings": team_rankings,
         "matches": [
             {
-                "id": match.id,
-                "team_a": match.team_a,
-                "team_b": match.team_b,
-                "goals_a": match.goals_a,
-                "goals_b": match.goals_b
+                "id": match_id,
+                "team_a": team_a,
+                "team_b": team_b,
+                "goals_a": goals_a,
+                "goals_b": goals_b
             }
-            for match in matches
+            for match_id, team_a, team_b, goals_a, goals_b, *_ in matches
         ],
-        "top_4_group_1": [{"team_name": team.name} for team in top_4_group_1],
-        "top_4_group_2": [{"team_name": team.name} for team in top_4_group_2]
     }
 
-# Clear all teams and matches from the database
+    # Get the qualifying teams of each group based on correct tiebreaker
+    for group_number in range(1, group_count + 1):
+        group = groups.get(group_number, [])
+        rankings[f"top_4_group_{group_number}"] = [{"team_name": team.name} for team in group[:rules.top_n]]
+
+    return rankings
+
+# Rankings and top teams right after match event as_of, replayed from the nearest checkpoint
+def build_rankings_as_of(repo: Repository, championship: models.Championship, as_of: int):
+    rules = championship.rules
+    matches = repo.get_matches_as_of(championship.id, as_of)
+    results = [(team_a_id, team_b_id, goals_a, goals_b) for _, _, _, goals_a, goals_b, team_a_id, team_b_id in matches]
+    ranked = ranking.rank_standings(repo.get_standings_as_of(championship.id, as_of), rules, results)
+    return format_rankings(ranked, matches, championship.group_count, rules)
+
+# Seconds between keepalive comments on an idle /rankings/stream
+STREAM_KEEPALIVE_SECONDS = 15
+
+# Sections of a /rankings/ body that include= can select; "top_4" stands for every top_4_group_<n> list
+RANKING_SECTIONS = ("rankings", "matches", "top_4")
+
+# Parse a comma-separated include parameter into a tuple of ranking sections
+def parse_include(include):
+    if not include:
+        return RANKING_SECTIONS
+    requested = {section.strip() for section in include.split(",") if section.strip()}
+    unknown = sorted(requested.difference(RANKING_SECTIONS))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown sections: {', '.join(unknown)}. Allowed: {', '.join(RANKING_SECTIONS)}")
+    return tuple(section for section in RANKING_SECTIONS if section in requested)
+
+# Keep only the selected sections of a rankings dict (as_of is always kept)
+def select_sections(rankings, sections):
+    if sections == RANKING_SECTIONS:
+        return rankings
+    return {
+        key: value for key, value in rankings.items()
+        if key == "as_of" or (key.startswith("top_4_group_") and "top_4" in sections) or key in sections
+    }
+
+# Serialize rankings with orjson, then compress them with the given coding when they are large enough.
+# Returns (body, coding applied or None).
+def encode_rankings(rankings, sections=RANKING_SECTIONS, encoding=None):
+    return compression.compress(orjson.dumps(select_sections(rankings, sections)), encoding)
+
+# Body of a snapshot's rankings, serialized at most once per section selection and coding.
+# Returns (body, coding applied or None).
+def rankings_body(snapshot: Snapshot, sections=RANKING_SECTIONS, encoding=None):
+    key = ("rankings", sections, encoding)
+    if key not in snapshot.derived:
+        if "rankings" not in snapshot.derived:
+            snapshot.derived["rankings"] = format_rankings(snapshot.ranked, snapshot.matches, snapshot.group_count, snapshot.rules)
+        snapshot.derived[key] = encode_rankings(snapshot.derived["rankings"], sections, encoding)
+    return snapshot.derived[key]
+
+# After a write commits, have the championship's snapshot replaced
+async def swap_snapshot(repo: Repository, championship: models.Championship):
+    snapshots.written(championship.id, eager=broadcaster.has_subscribers(championship.id))
+
+# Push the rankings of every new snapshot to the championship's open streams
+def publish_rankings(snapshot: Snapshot):
+    if broadcaster.has_subscribers(snapshot.championship_id):
+        broadcaster.publish(snapshot.championship_id, snapshot.version, rankings_body(snapshot)[0])
+
+snapshots.on_swap = publish_rankings
+
+# Single writer for /teams/ and /matches/ additions when WRITE_QUEUE is on; it swaps in a new
+# snapshot once per committed group rather than once per request
+writer = GroupCommitWriter(WRITE_QUEUE_MAX_BATCH, WRITE_QUEUE_WAIT_MS / 1000, on_commit=swap_snapshot)
+
+# Parse the entity tags listed in an If-None-Match header
+def parse_etags(header):
+    if not header:
+        return set()
+    return {tag.strip().removeprefix("W/") for tag in header.split(",")}
+
+# Get rankings and top 4 teams, revalidated through the data version ETag. Current rankings are served
+# from the championship's snapshot, so they never wait on the database while writes are being committed.
+# as_of gives the rankings right after that match event (see /events), replayed from the nearest checkpoint.
+# include= picks the sections to send (rankings, matches, top_4), and bodies of COMPRESS_MIN_BYTES or more
+# are gzip- or brotli-encoded when the client accepts it.
+# The body is encoded ahead of time and returned as is, so schemas.Rankings documents it rather than filtering it
+@app.get("/rankings/", responses={200: {"model": schemas.Rankings}})
+async def get_rankings(
+    request: Request,
+    as_of: Optional[int] = Query(None, ge=0),
+    include: Optional[str] = None,
+    championship: models.Championship = Depends(get_championship),
+    repo: Repository = Depends(get_repository),
+):
+    sections = parse_include(include)
+    encoding = compression.choose_encoding(request.headers.get("accept-encoding"))
+
+    if as_of is None:
+        snapshot = await snapshots.read(repo, championship)
+        tag = f"{championship.id}-{snapshot.version}"
+    else:
+        # The version is read before the data, so a tag never claims newer data than the body holds
+        tag = f"{championship.id}-{championship.version}-{as_of}"
+    if sections != RANKING_SECTIONS:
+        tag += "-" + "+".join(sections)
+    etag = f'"{tag}"'
+
+    tags = parse_etags(request.headers.get("if-none-match"))
+    if etag in tags or "*" in tags:
+        return Response(status_code=304, headers={"ETag": etag, "Vary": "Accept-Encoding"})
+
+    if as_of is None:
+        body, applied = rankings_body(snapshot, sections, encoding)
+    else:
+        rankings = {"as_of": as_of, **await repo.run(build_rankings_as_of, repo, championship, as_of)}
+        body, applied = encode_rankings(rankings, sections, encoding)
+
+    headers = {"ETag": etag, "Vary": "Accept-Encoding"}
+    if applied is not None:
+        # A compressed body is only semantically equal to the identity one, so its tag is weak
+        headers["ETag"] = "W/" + etag
+        headers["Content-Encoding"] = applied
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# Current standings, played results, remaining fixtures and scoring rate of every group, as inputs to the simulator
+def projection_inputs(snapshot: Snapshot):
+    groups = ranking.group_ranked(snapshot.ranked)
+    played = snapshot.played_pairs
+    head_to_head = ranking.compile_rules(snapshot.rules).head_to_head
+    matches = snapshot.matches
+    if matches:
+        goals_per_match = sum(match.goals_a + match.goals_b for match in matches) / (2 * len(matches))
+    else:
+        goals_per_match = ranking.DEFAULT_GOALS_PER_MATCH
+
+    inputs = []
+    for group_number, group in groups.items():
+        position = {team.id: i for i, team in enumerate(group)}
+        registration_rank, id_rank = [0] * len(group), [0] * len(group)
+        for rank, team in enumerate(sorted(group, key=lambda team: (team.registration_key, team.id))):
+            registration_rank[position[team.id]] = rank
+        for rank, team in enumerate(sorted(group, key=lambda team: team.id)):
+            id_rank[position[team.id]] = rank
+        # Results among the group's teams, only needed for head_to_head
+        results = [
+            (position[match.team_a_id], position[match.team_b_id], match.goals_a, match.goals_b)
+            for match in matches if match.team_a_id in position
+        ] if head_to_head else []
+        fixtures = [(position[a], position[b]) for a, b in ranking.unplayed_fixtures(position, played)]
+        current = np.array([(team.match_points, team.goals_scored, team.alternate_points) for team in group], dtype=np.int64).reshape(-1, 3)
+        inputs.append((group_number, group, (current, registration_rank, id_rank, results), fixtures))
+    return inputs, goals_per_match
+
+async def compute_projections(snapshot: Snapshot, simulations: int):
+    inputs, goals_per_match = projection_inputs(snapshot)
+
+    # Seeded by championship and version, so a given data version always projects the same numbers
+    async def project(group_number, group, standings, fixtures):
+        runs = simulations if fixtures else 1  # nothing left to play: one pass gives the final table
+        counts = await ranking.run_simulations(
+            standings, fixtures, goals_per_match, runs, [snapshot.championship_id, snapshot.version, group_number], snapshot.rules,
+        )
+        remaining = {}
+        for a, b in fixtures:
+            remaining[a] = remaining.get(a, 0) + 1
+            remaining[b] = remaining.get(b, 0) + 1
+        return {
+            "group_number": group_number,
+            "remaining_fixtures": len(fixtures),
+            "teams": [
+                {
+                    "team_name": team.name,
+                    "match_points": team.match_points,
+                    "remaining_matches": remaining.get(i, 0),
+                    "top_4_probability": round(float(counts[i]) / runs, 4),
+                }
+                for i, team in enumerate(group)
+            ],
+        }
+
+    return {
+        "championship_id": snapshot.championship_id,
+        "version": snapshot.version,
+        "simulations": simulations,
+        "goals_per_match": round(goals_per_match, 3),
+        "groups": await asyncio.gather(*(project(*group) for group in inputs)),
+    }
+
+# Probability of each team finishing in its group's top 4, simulating the unplayed fixtures.
+# Results are kept with the snapshot they were computed from, per simulation count.
+@app.get("/rankings/projections")
+async def get_projections(
+    simulations: int = Query(10000, ge=1, le=1000000),
+    championship: models.Championship = Depends(get_championship),
+    repo: Repository = Depends(get_repository),
+):
+    snapshot = await snapshots.read(repo, championship)
+    # The simulations only need the snapshot, so give the pooled connection back now
+    await repo.close()
+
+    key = ("projections", simulations)
+    if key not in snapshot.derived:
+        snapshot.derived[key] = await compute_projections(snapshot, simulations)
+    return snapshot.derived[key]
+
+# Stream a rankings snapshot as a Server-Sent Event after every committed write
+@app.get("/rankings/stream")
+async def stream_rankings(request: Request, championship: models.Championship = Depends(get_championship), repo: Repository = Depends(get_repository)):
+    queue = broadcaster.subscribe(championship.id)
+
+    # Start with the current snapshot unless the client already holds it (reconnect with Last-Event-ID)
+    snapshot = await snapshots.read(repo, championship)
+    initial = None
+    if request.headers.get("last-event-id") != str(snapshot.version):
+        initial = (snapshot.version, rankings_body(snapshot)[0])
+
+    # The stream only waits on the broadcaster, so give the pooled connection back now
+    await repo.close()
+
+    async def events():
+        try:
+            if initial is not None:
+                yield sse_event(*initial)
+            while not await request.is_disconnected():
+                try:
+                    version, body = await asyncio.wait_for(queue.get(), timeout=STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                else:
+                    yield sse_event(version, body)
+        finally:
+            broadcaster.unsubscribe(championship.id, queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+# Page through a championship's match events; pass an event's seq as /rankings/?as_of= to see the rankings after it
+@app.get("/events", response_model=schemas.Page)
+async def list_match_events(
+    after_seq: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    championship: models.Championship = Depends(get_championship),
+    repo: Repository = Depends(get_repository),
+):
+    rows = await repo.run(repo.list_match_events, championship.id, after_seq, limit)
+    items = [row._asdict() for row in rows]
+    return schemas.Page(items=items, next_after_id=items[-1]["seq"] if len(items) == limit else None)
+
+
+# Incremental sync: the team and match changes after seq `since`, oldest first. Each carries the row as
+# written, to be applied as an upsert by kind and id. Starting from since=0 replays the whole feed.
+@app.get("/changes", response_model=schemas.ChangePage)
+async def list_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    championship: models.Championship = Depends(get_championship),
+    repo: Repository = Depends(get_repository),
+):
+    cleared, last_seq = await repo.run(repo.get_change_bounds, championship.id)
+    rows = await repo.run(repo.list_changes, championship.id, since, limit)
+    changes = [{"seq": seq, "kind": kind, "op": op, "row": row} for seq, kind, op, row in rows]
+    return schemas.ChangePage(
+        changes=changes,
+        next_since=changes[-1]["seq"] if changes else since,
+        last_seq=last_seq,
+        resync_required=0 < since < cleared,
+    )
+
+
+# Clear a championship's teams and matches, leaving other championships untouched.
+# With archive=true they are first snapshotted into Parquet files under ARCHIVE_DIR.
 @app.delete("/clear/")
-def clear_data(db: Session = Depends(get_db)):
-    log_change("Cleared", "Championship", "", "Previous Championship Data Deleted. Starting New Championship!")
-    crud.clear_all_data(db)
+async def clear_data(archive: bool = False, championship: models.Championship = Depends(get_writable_championship), repo: Repository = Depends(get_repository)):
+    archive_path = None
+    if archive:
+        # Archived and cleared in one write transaction, so a write in between is neither lost nor left behind
+        archive_path = await repo.run_blocking(archives.write_archive, championship.id, True)
+        log_change("Archived", "Championship", championship.name, f"Data saved to {archive_path}", championship)
+    else:
+        await repo.run(repo.clear_championship, championship.id)
+
+    log_change("Cleared", "Championship", championship.name, "Previous Championship Data Deleted. Starting New Championship!")
+    await swap_snapshot(repo, championship)
     
-    return {"message": "All data cleared"}
+    return {"message": "All data cleared", "archive": archive_path}
+
+
+# Stream a championship's teams and matches as JSON lines, in the format /import reads
+@app.get("/export")
+async def export_championship(championship: models.Championship = Depends(get_championship), repo: Repository = Depends(get_repository)):
+    # The stream reads through a session of its own, so give the pooled connection back now
+    await repo.close()
+    return StreamingResponse(
+        archives.export_lines(championship),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="championship-{championship.id}.jsonl"'},
+    )
+
+
+# Most rejected rows listed in an /import response
+IMPORT_ERROR_LIMIT = 100
+
+# Validate the team or match records of one chunk against the index, returning (line, accepted entry)
+# pairs and (line, error) pairs
+def validate_records(records, model, accept):
+    accepted, rejected = [], []
+    for line, record in records:
+        try:
+            accepted.append((line, accept(model(**record))))
+        except HTTPException as e:
+            rejected.append((line, e.detail))
+        except ValidationError as e:
+            rejected.append((line, "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors())))
+    return accepted, rejected
+
+# Load JSON lines (as written by /export) into a championship, reading and committing one chunk at a time.
+# Teams of a chunk are added before its matches, so matches may refer to teams from the same chunk.
+@app.post("/import", response_model=schemas.ImportResult)
+async def import_championship(request: Request, championship: models.Championship = Depends(get_writable_championship), repo: Repository = Depends(get_repository)):
+    teams_added = matches_added = 0
+    rejected = []
+
+    async for chunk in archives.read_records(request.stream(), IMPORT_CHUNK_ROWS):
+        records = {"team": [], "match": []}
+        for line, record in chunk:
+            record_type = record.get("type") if record is not None else None
+            if record_type in records:
+                records[record_type].append((line, record))
+            elif record is None:
+                rejected.append((line, "Not a JSON object"))
+            elif record_type != "championship":  # championship records describe the source and are skipped
+                rejected.append((line, f"Unknown record type: {record_type}"))
+
+        for record_type, model, add in (
+            ("team", schemas.TeamCreate, repo.create_teams),
+            ("match", schemas.MatchCreate, repo.create_matches),
+        ):
+            if not records[record_type]:
+                continue
+            index = await repo.run(validation.get_index, repo, championship)
+            accept = index.copy().accept_team if record_type == "team" else index.copy().accept_match
+            accepted, chunk_rejected = validate_records(records[record_type], model, accept)
+            rejected.extend(chunk_rejected)
+            if not accepted:
+                continue
+
+            version = index.version
+            try:
+                created, committed = await repo.run(add, championship.id, [entry for _, entry in accepted])
+            except ConflictError:
+                await repo.refresh(championship)
+                rejected.extend((line, f"Conflicts with a {record_type} added concurrently") for line, _ in accepted)
+                continue
+            if record_type == "team":
+                index.added_teams(version, committed, created)
+                teams_added += len(created)
+            else:
+                index.added_pairs(version, committed, [validation.pair_of(team_a, team_b) for _, (_, team_a, team_b) in accepted])
+                matches_added += len(created)
+
+    log_change("Imported", "Championship", championship.name, f"{teams_added} teams, {matches_added} matches, {len(rejected)} rows rejected", championship)
+    if teams_added or matches_added:
+        await swap_snapshot(repo, championship)
+
+    rejected.sort()
+    return schemas.ImportResult(
+        teams_added=teams_added,
+        matches_added=matches_added,
+        rejected=len(rejected),
+        errors=[schemas.BulkRowResult(index=line, accepted=False, detail=detail) for line, detail in rejected[:IMPORT_ERROR_LIMIT]],
+    )
+
+
+# Page through the data change log; omit after_seq to get the latest entries
+@app.get("/log", response_model=schemas.LogPage)
+async def get_log(after_seq: Optional[int] = Query(None, ge=0), limit: int = Query(100, ge=1, le=1000)):
+    entries, last_seq = audit.read(after_seq, limit)
+    next_after_seq = entries[-1]["seq"] if entries else max(after_seq or 0, 0)
+    return schemas.LogPage(entries=entries, next_after_seq=next_after_seq, last_seq=last_seq)
+
+# Per-route latency, status and SQL metrics in the Prometheus text format
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
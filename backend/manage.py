@@ -0,0 +1,31 @@
+import argparse
+import sys
+from . import models, crud, migrations
+from .database import engine, SessionLocal
+
+# Maintenance commands, e.g. `python -m backend.manage check-standings`
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Football Championship maintenance commands")
+    parser.add_argument("command", choices=["check-standings", "rebuild-standings", "compact-changes"])
+    args = parser.parse_args(argv)
+
+    # Upgrade older databases the same way the API does on startup
+    models.Base.metadata.create_all(bind=engine)
+    migrations.migrate(engine)
+    with SessionLocal() as db:
+        if args.command == "check-standings":
+            mismatches = crud.check_standings(db)
+            if mismatches:
+                print(f"Standings out of date for team ids: {', '.join(map(str, mismatches))}")
+                return 1
+            print("Standings are consistent with matches.")
+        elif args.command == "rebuild-standings":
+            count = crud.rebuild_standings(db)
+            print(f"Rebuilt standings for {count} teams.")
+        else:
+            count = crud.compact_changes(db)
+            print(f"Dropped {count} superseded changes.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
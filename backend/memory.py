@@ -0,0 +1,395 @@
+import bisect
+from collections import defaultdict, namedtuple
+from functools import lru_cache
+from itertools import count
+from .ranking import registration_key, match_result_points, add_match_totals, rank_standings, dump_rules, load_rules
+from .repository import ConflictError, Repository
+
+# Compact records of the in-memory backend, carrying the attributes of the matching SQLAlchemy models
+class ChampionshipRecord:
+    __slots__ = ("id", "name", "group_count", "group_capacity", "archived", "version", "rules_json")
+
+    def __init__(self, id, name, group_count, group_capacity, rules_json=None):
+        self.id = id
+        self.name = name
+        self.group_count = group_count
+        self.group_capacity = group_capacity
+        self.archived = False
+        self.version = 0
+        self.rules_json = rules_json
+
+    @property
+    def rules(self):
+        return load_rules(self.rules_json)
+
+class TeamRecord:
+    __slots__ = ("id", "championship_id", "name", "registration_date", "group_number")
+
+    def __init__(self, id, championship_id, name, registration_date, group_number):
+        self.id = id
+        self.championship_id = championship_id
+        self.name = name
+        self.registration_date = registration_date
+        self.group_number = group_number
+
+class StandingRecord:
+    __slots__ = ("team_id", "match_points", "goals_scored", "alternate_points", "registration_key")
+
+    def __init__(self, team_id, registration_key, match_points=0, goals_scored=0, alternate_points=0):
+        self.team_id = team_id
+        self.match_points = match_points
+        self.goals_scored = goals_scored
+        self.alternate_points = alternate_points
+        self.registration_key = registration_key
+
+# A match holds its two team records, so renaming a team shows up in its matches straight away
+class MatchRecord:
+    __slots__ = ("id", "championship_id", "team_a_ref", "team_b_ref", "goals_a", "goals_b")
+
+    def __init__(self, id, championship_id, team_a_ref, team_b_ref, goals_a, goals_b):
+        self.id = id
+        self.championship_id = championship_id
+        self.team_a_ref = team_a_ref
+        self.team_b_ref = team_b_ref
+        self.goals_a = goals_a
+        self.goals_b = goals_b
+
+    @property
+    def team_a(self):
+        return self.team_a_ref.name
+
+    @property
+    def team_b(self):
+        return self.team_b_ref.name
+
+    @property
+    def team_a_id(self):
+        return self.team_a_ref.id
+
+    @property
+    def team_b_id(self):
+        return self.team_b_ref.id
+
+    @property
+    def pair_low_id(self):
+        return min(self.team_a_ref.id, self.team_b_ref.id)
+
+    @property
+    def pair_high_id(self):
+        return max(self.team_a_ref.id, self.team_b_ref.id)
+
+class EventRecord:
+    __slots__ = ("seq", "match_id", "team_a_id", "team_b_id", "goals_a", "goals_b",
+                 "prev_team_a_id", "prev_team_b_id", "prev_goals_a", "prev_goals_b")
+
+    def __init__(self, seq, db_match, prev=None):
+        self.seq = seq
+        self.match_id = db_match.id
+        self.team_a_id = db_match.team_a_id
+        self.team_b_id = db_match.team_b_id
+        self.goals_a = db_match.goals_a
+        self.goals_b = db_match.goals_b
+        self.prev_team_a_id, self.prev_team_b_id, self.prev_goals_a, self.prev_goals_b = prev or (None, None, None, None)
+
+EventRow = namedtuple("EventRow", "seq match_id team_a team_b goals_a goals_b prev_goals_a prev_goals_b")
+ChangeRow = namedtuple("ChangeRow", "seq kind op row")
+
+# Row type for a fields= projection, so pages are built the same way as from SQL rows
+@lru_cache(maxsize=None)
+def _row_type(columns):
+    return namedtuple("Row", columns)
+
+# Process-local data of the in-memory backend, with the lookups the endpoints need kept as dict/set
+# indexes. Nothing survives a restart, which suits tests, benchmarks and demo instances.
+class MemoryStore:
+    def __init__(self):
+        self.championships = {}  # id -> ChampionshipRecord
+        self.teams = defaultdict(dict)  # championship id -> {team id: TeamRecord}, in id order
+        self.team_names = defaultdict(dict)  # championship id -> {name: TeamRecord}
+        self.standings = {}  # team id -> StandingRecord
+        self.matches = defaultdict(dict)  # championship id -> {match id: MatchRecord}, in id order
+        self.team_matches = defaultdict(set)  # team id -> ids of the matches it played, on either side
+        self.pairs = {}  # (lower team id, higher team id) -> match id
+        self.events = defaultdict(list)  # championship id -> [EventRecord], in seq order
+        self.changes = defaultdict(list)  # championship id -> [ChangeRow], in seq order
+        self.ids = defaultdict(lambda: count(1))  # next id per record kind
+        # Like a fresh database, the store starts with the default championship
+        self.add_championship("Championship 1", 2, 6)
+
+    def add_championship(self, name, group_count, group_capacity, rules_json=None):
+        championship = ChampionshipRecord(next(self.ids["championship"]), name, group_count, group_capacity, rules_json)
+        self.championships[championship.id] = championship
+        return championship
+
+    # Add (sign=1) or take back (sign=-1) a match result in both teams' standings
+    def apply_result(self, rules, team_a_id, team_b_id, goals_a, goals_b, sign=1):
+        points_a, points_b = match_result_points(goals_a, goals_b, rules)
+        for team_id, goals, (match_points, alternate_points) in ((team_a_id, goals_a, points_a), (team_b_id, goals_b, points_b)):
+            standing = self.standings[team_id]
+            standing.match_points += sign * match_points
+            standing.goals_scored += sign * goals
+            standing.alternate_points += sign * alternate_points
+
+    def record_event(self, championship_id, db_match, prev=None):
+        self.events[championship_id].append(EventRecord(next(self.ids["event"]), db_match, prev))
+
+    # Append a team or match to the change feed as it now stands (same rows as the SQL backend)
+    def record_change(self, championship_id, op, team=None, match=None):
+        if team is not None:
+            kind, row = "team", {"id": team.id, "name": team.name, "registration_date": team.registration_date, "group_number": team.group_number}
+        else:
+            kind, row = "match", {
+                "id": match.id, "team_a_id": match.team_a_id, "team_b_id": match.team_b_id, "team_a": match.team_a, "team_b": match.team_b,
+                "goals_a": match.goals_a, "goals_b": match.goals_b,
+            }
+        self.changes[championship_id].append(ChangeRow(next(self.ids["change"]), kind, op, row))
+
+# The in-memory backend. Every method runs to completion on the event loop thread, so each write is
+# atomic without locks; conflicting rows are rejected before anything changes.
+class MemoryRepository(Repository):
+    def __init__(self, store: MemoryStore):
+        self.store = store
+
+    def _bump_version(self, championship_id):
+        championship = self.store.championships[championship_id]
+        championship.version += 1
+        return championship.version
+
+    def get_championship(self, championship_id):
+        return self.store.championships.get(championship_id)
+
+    def get_championship_version(self, championship_id):
+        return self.store.championships[championship_id].version
+
+    def get_championships(self):
+        return sorted(self.store.championships.values(), key=lambda championship: championship.id)
+
+    def create_championship(self, championship):
+        return self.store.add_championship(
+            championship.name, championship.group_count, championship.group_capacity, dump_rules(championship.rules)
+        )
+
+    def archive_championship(self, championship):
+        championship.archived = True
+        championship.version += 1
+        return championship
+
+    def get_team(self, championship_id, team_name):
+        return self.store.team_names[championship_id].get(team_name)
+
+    def get_team_details(self, championship_id):
+        return [(team.id, team.name, team.group_number, team.registration_date) for team in self.store.teams[championship_id].values()]
+
+    def list_teams(self, championship_id, columns, after_id=0, limit=100, group_number=None, name=None):
+        row = _row_type(tuple(columns))
+        name = name.casefold() if name else None
+        rows = []
+        for team in self.store.teams[championship_id].values():
+            if len(rows) == limit:
+                break
+            if team.id <= after_id or (group_number is not None and team.group_number != group_number):
+                continue
+            if name and name not in team.name.casefold():
+                continue
+            rows.append(row(*[getattr(team, column) for column in columns]))
+        return rows
+
+    # Same matching as the SQL backend: any part of the name from 3 characters, a name prefix below that
+    def search_teams(self, championship_id, query, limit=20):
+        if len(query) >= 3:
+            query = query.casefold()
+            matches = (team for team in self.store.teams[championship_id].values() if query in team.name.casefold())
+        else:
+            query = query.lower()
+            matches = (team for team in self.store.teams[championship_id].values() if team.name.lower().startswith(query))
+        return [team for team, _ in zip(matches, range(limit))]
+
+    def create_teams(self, championship_id, teams):
+        names = self.store.team_names[championship_id]
+        if len({team.name for team in teams}) != len(teams) or any(team.name in names for team in teams):
+            raise ConflictError("team name already exists")
+
+        created = []
+        for team in teams:
+            db_team = TeamRecord(next(self.store.ids["team"]), championship_id, team.name, team.registration_date, team.group_number)
+            self.store.teams[championship_id][db_team.id] = db_team
+            names[db_team.name] = db_team
+            self.store.standings[db_team.id] = StandingRecord(db_team.id, registration_key(db_team.registration_date))
+            self.store.record_change(championship_id, "insert", team=db_team)
+            created.append(db_team)
+        return created, self._bump_version(championship_id)
+
+    def update_team(self, championship_id, team_id, team):
+        db_team = self.store.teams[championship_id][team_id]
+        names = self.store.team_names[championship_id]
+        if team.name != db_team.name and team.name in names:
+            raise ConflictError("team name already exists")
+
+        del names[db_team.name]
+        db_team.name = team.name
+        db_team.registration_date = team.registration_date
+        db_team.group_number = team.group_number
+        names[db_team.name] = db_team
+        self.store.standings[team_id].registration_key = registration_key(team.registration_date)
+        self.store.record_change(championship_id, "update", team=db_team)
+        return self._bump_version(championship_id)
+
+    def get_match(self, championship_id, match_id):
+        return self.store.matches[championship_id].get(match_id)
+
+    def get_played_pairs(self, championship_id):
+        return {(match.pair_low_id, match.pair_high_id) for match in self.store.matches[championship_id].values()}
+
+    def get_match_rows(self, championship_id):
+        return [
+            (match.id, match.team_a, match.team_b, match.goals_a, match.goals_b, match.team_a_id, match.team_b_id)
+            for match in self.store.matches[championship_id].values()
+        ]
+
+    def get_team_matches(self, championship_id, team_id):
+        matches = self.store.matches[championship_id]
+        return [matches[match_id] for match_id in sorted(self.store.team_matches.get(team_id, ()))]
+
+    def list_matches(self, championship_id, columns, after_id=0, limit=100, group_number=None, team=None, goals_a=None, goals_b=None):
+        row = _row_type(tuple(columns))
+        team = team.casefold() if team else None
+        rows = []
+        for match in self.store.matches[championship_id].values():
+            if len(rows) == limit:
+                break
+            if match.id <= after_id or (group_number is not None and match.team_a_ref.group_number != group_number):
+                continue
+            if team and team not in match.team_a.casefold() and team not in match.team_b.casefold():
+                continue
+            if (goals_a is not None and match.goals_a != goals_a) or (goals_b is not None and match.goals_b != goals_b):
+                continue
+            rows.append(row(*[getattr(match, column) for column in columns]))
+        return rows
+
+    def create_matches(self, championship_id, entries):
+        pairs = [(min(team_a.id, team_b.id), max(team_a.id, team_b.id)) for _, team_a, team_b in entries]
+        if len(set(pairs)) != len(pairs) or any(pair in self.store.pairs for pair in pairs):
+            raise ConflictError("match pairing already exists")
+
+        teams, rules = self.store.teams[championship_id], self.store.championships[championship_id].rules
+        created = []
+        for (match, team_a, team_b), pair in zip(entries, pairs):
+            db_match = MatchRecord(next(self.store.ids["match"]), championship_id, teams[team_a.id], teams[team_b.id], match.goals_a, match.goals_b)
+            self.store.matches[championship_id][db_match.id] = db_match
+            self.store.pairs[pair] = db_match.id
+            self.store.team_matches[team_a.id].add(db_match.id)
+            self.store.team_matches[team_b.id].add(db_match.id)
+            self.store.apply_result(rules, team_a.id, team_b.id, match.goals_a, match.goals_b)
+            self.store.record_event(championship_id, db_match)
+            self.store.record_change(championship_id, "insert", match=db_match)
+            created.append(db_match)
+        return created, self._bump_version(championship_id)
+
+    def update_match(self, db_match, match, team_a, team_b):
+        old_pair = (db_match.pair_low_id, db_match.pair_high_id)
+        new_pair = (min(team_a.id, team_b.id), max(team_a.id, team_b.id))
+        if new_pair != old_pair and new_pair in self.store.pairs:
+            raise ConflictError("match pairing already exists")
+
+        rules = self.store.championships[db_match.championship_id].rules
+        prev = (db_match.team_a_id, db_match.team_b_id, db_match.goals_a, db_match.goals_b)
+        self.store.apply_result(rules, *prev, sign=-1)
+        for team_id in prev[:2]:
+            self.store.team_matches[team_id].discard(db_match.id)
+        del self.store.pairs[old_pair]
+
+        teams = self.store.teams[db_match.championship_id]
+        db_match.team_a_ref, db_match.team_b_ref = teams[team_a.id], teams[team_b.id]
+        db_match.goals_a, db_match.goals_b = match.goals_a, match.goals_b
+        self.store.pairs[new_pair] = db_match.id
+        self.store.team_matches[team_a.id].add(db_match.id)
+        self.store.team_matches[team_b.id].add(db_match.id)
+        self.store.apply_result(rules, team_a.id, team_b.id, match.goals_a, match.goals_b)
+        self.store.record_event(db_match.championship_id, db_match, prev)
+        self.store.record_change(db_match.championship_id, "update", match=db_match)
+        return db_match, self._bump_version(db_match.championship_id)
+
+    def get_ranked_standings(self, championship_id, rules):
+        rules = rules._replace(tiebreakers=tuple(criterion for criterion in rules.tiebreakers if criterion != "head_to_head"))
+        return rank_standings(((team, self.store.standings[team.id]) for team in self.store.teams[championship_id].values()), rules)
+
+    # Replays the championship's events up to as_of; with everything in memory no checkpoints are needed
+    def get_standings_as_of(self, championship_id, as_of):
+        totals, rules = {}, self.store.championships[championship_id].rules
+        for event in self._events_until(championship_id, as_of):
+            if event.prev_goals_a is not None:
+                add_match_totals(totals, event.prev_team_a_id, event.prev_team_b_id, event.prev_goals_a, event.prev_goals_b, rules, sign=-1)
+            add_match_totals(totals, event.team_a_id, event.team_b_id, event.goals_a, event.goals_b, rules)
+        return [
+            (team, StandingRecord(team.id, registration_key(team.registration_date), *totals.get(team.id, (0, 0, 0))))
+            for team in self.store.teams[championship_id].values()
+        ]
+
+    def get_matches_as_of(self, championship_id, as_of):
+        latest = {}
+        for event in self._events_until(championship_id, as_of):
+            latest[event.match_id] = event
+        teams = self.store.teams[championship_id]
+        return [
+            (match_id, teams[event.team_a_id].name, teams[event.team_b_id].name, event.goals_a, event.goals_b, event.team_a_id, event.team_b_id)
+            for match_id, event in sorted(latest.items())
+        ]
+
+    def _events_until(self, championship_id, as_of):
+        events = self.store.events[championship_id]
+        return events[:bisect.bisect_right(events, as_of, key=lambda event: event.seq)]
+
+    def list_match_events(self, championship_id, after_seq=0, limit=100):
+        events = self.store.events[championship_id]
+        start = bisect.bisect_right(events, after_seq, key=lambda event: event.seq)
+        teams = self.store.teams[championship_id]
+        return [
+            EventRow(event.seq, event.match_id, teams[event.team_a_id].name, teams[event.team_b_id].name,
+                     event.goals_a, event.goals_b, event.prev_goals_a, event.prev_goals_b)
+            for event in events[start:start + limit]
+        ]
+
+    def list_changes(self, championship_id, since=0, limit=100):
+        changes = self.store.changes[championship_id]
+        start = bisect.bisect_right(changes, since, key=lambda change: change.seq)
+        return changes[start:start + limit]
+
+    def get_change_bounds(self, championship_id):
+        changes = self.store.changes[championship_id]
+        cleared = changes[0].seq if changes and changes[0].op == "clear" else 0
+        return cleared, changes[-1].seq if changes else 0
+
+    # Writes run one at a time on the event loop, so there is nothing to hold off
+    def lock_writes(self, championship_id):
+        pass
+
+    def clear_championship(self, championship_id):
+        for team_id in self.store.teams.pop(championship_id, {}):
+            self.store.standings.pop(team_id, None)
+            self.store.team_matches.pop(team_id, None)
+        for match in self.store.matches.pop(championship_id, {}).values():
+            self.store.pairs.pop((match.pair_low_id, match.pair_high_id), None)
+        self.store.team_names.pop(championship_id, None)
+        self.store.events.pop(championship_id, None)
+        self.store.changes[championship_id] = [ChangeRow(next(self.store.ids["change"]), "championship", "clear", None)]
+        self._bump_version(championship_id)
+
+    # The rows are copied up front, so a caller that writes while iterating still reads one consistent state
+    def export_rows(self, kind, championship_id, size):
+        if kind == "teams":
+            teams = list(self.store.teams[championship_id].values())
+            rows = []
+            for team in teams:
+                standing = self.store.standings[team.id]
+                rows.append({
+                    "id": team.id, "name": team.name, "registration_date": team.registration_date, "group_number": team.group_number,
+                    "match_points": standing.match_points, "goals_scored": standing.goals_scored, "alternate_points": standing.alternate_points,
+                })
+        else:
+            matches = list(self.store.matches[championship_id].values())
+            rows = [
+                {"id": match.id, "team_a": match.team_a, "team_b": match.team_b, "goals_a": match.goals_a, "goals_b": match.goals_b}
+                for match in matches
+            ]
+        for start in range(0, len(rows), size):
+            yield rows[start:start + size]
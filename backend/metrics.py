@@ -0,0 +1,151 @@
+import bisect
+import contextvars
+import logging
+import time
+from sqlalchemy import event
+from .config import SLOW_REQUEST_MS, SLOW_REQUEST_SQL_CHARS
+
+# Upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Upper bounds of the statements-per-request histogram buckets
+STATEMENT_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128)
+
+slow_logger = logging.getLogger("championship.slow_requests")
+
+# Database work done on behalf of one request
+class RequestStats:
+    __slots__ = ("statements", "db_seconds", "trace")
+
+    def __init__(self, trace):
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.trace = [] if trace else None  # (statement, seconds), kept only when slow requests are logged
+
+# Stats of the request being served. The handlers' thread pool and SQLAlchemy's greenlets run in a copy
+# of the request's context, so statements are always charged to the request that issued them.
+current_request = contextvars.ContextVar("current_request", default=None)
+
+# Cumulative histogram with Prometheus-style `le` buckets
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f"{name}_sum{{{labels}}} {self.total}"
+        yield f"{name}_count{{{labels}}} {self.count}"
+
+# Per-route request metrics. Only the event loop thread observes requests, so no locking is needed.
+class Registry:
+    def __init__(self):
+        self.latency = {}  # (method, route) -> Histogram of seconds until the response starts
+        self.statements = {}  # (method, route) -> Histogram of SQL statements per request
+        self.db_seconds = {}  # (method, route) -> total seconds spent executing SQL
+        self.responses = {}  # (method, route, status) -> count
+
+    def observe(self, method, route, status, seconds, stats):
+        key = (method, route)
+        self.latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(seconds)
+        self.statements.setdefault(key, Histogram(STATEMENT_BUCKETS)).observe(stats.statements)
+        self.db_seconds[key] = self.db_seconds.get(key, 0.0) + stats.db_seconds
+        self.responses[(method, route, status)] = self.responses.get((method, route, status), 0) + 1
+
+    # Render every metric in the Prometheus text exposition format
+    def render(self):
+        lines = [
+            "# HELP http_requests_total Requests served, by route and status code.",
+            "# TYPE http_requests_total counter",
+        ]
+        for (method, route, status), count in sorted(self.responses.items()):
+            lines.append(f'http_requests_total{{method="{method}",route="{route}",status="{status}"}} {count}')
+
+        lines += [
+            "# HELP http_request_duration_seconds Time until the response starts, by route.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (method, route), histogram in sorted(self.latency.items()):
+            lines.extend(histogram.lines("http_request_duration_seconds", f'method="{method}",route="{route}"'))
+
+        lines += [
+            "# HELP db_statements_per_request SQL statements executed per request, by route.",
+            "# TYPE db_statements_per_request histogram",
+        ]
+        for (method, route), histogram in sorted(self.statements.items()):
+            lines.extend(histogram.lines("db_statements_per_request", f'method="{method}",route="{route}"'))
+
+        lines += [
+            "# HELP db_time_seconds_total Time spent executing SQL, by route.",
+            "# TYPE db_time_seconds_total counter",
+        ]
+        for (method, route), seconds in sorted(self.db_seconds.items()):
+            lines.append(f'db_time_seconds_total{{method="{method}",route="{route}"}} {seconds}')
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+# SQLAlchemy engine hooks charging each statement and its execution time to the current request
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    stats = current_request.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.db_seconds += elapsed
+        if stats.trace is not None:
+            stats.trace.append((statement[:SLOW_REQUEST_SQL_CHARS], elapsed))
+
+def instrument(sync_engine):
+    event.listen(sync_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", after_cursor_execute)
+
+# ASGI middleware recording latency and database work per route. Latency is measured until the
+# response starts, so long-lived streams count their time to first byte rather than their lifetime.
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats(trace=SLOW_REQUEST_MS > 0)
+        token = current_request.set(stats)
+        start = time.perf_counter()
+        response = {"status": 500, "seconds": None}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["seconds"] = time.perf_counter() - start
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_request.reset(token)
+            seconds = response["seconds"] if response["seconds"] is not None else time.perf_counter() - start
+            # Label by route template, not raw path, so /teams/{team_name} stays a single series
+            route = getattr(scope.get("route"), "path", "unmatched")
+            registry.observe(scope["method"], route, response["status"], seconds, stats)
+            if SLOW_REQUEST_MS > 0 and seconds * 1000 >= SLOW_REQUEST_MS:
+                log_slow_request(scope, response["status"], seconds, stats)
+
+def log_slow_request(scope, status, seconds, stats):
+    trace = "".join(f"\n  {elapsed * 1000:8.2f} ms  {statement}" for statement, elapsed in stats.trace)
+    slow_logger.warning(
+        "%s %s -> %s in %.1f ms, %d SQL statements in %.1f ms%s",
+        scope["method"], scope["path"], status, seconds * 1000, stats.statements, stats.db_seconds * 1000, trace,
+    )
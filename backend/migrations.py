@@ -0,0 +1,146 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.schema import CreateIndex
+from . import models
+
+# Bring databases created by older versions up to the current schema.
+# Runs after create_all, which only creates tables that do not exist yet.
+def migrate(engine):
+    _add_championships(engine)
+    _add_championship_rules(engine)
+    _link_matches_to_teams(engine)
+    _backfill_match_events(engine)
+    _backfill_changes(engine)
+    _add_team_search(engine)
+
+    # create_all skips indexes on tables that already existed. IF NOT EXISTS rather than checkfirst,
+    # which cannot see expression indexes such as lower(name)
+    with engine.begin() as conn:
+        for table in (models.Team.__table__, models.Match.__table__):
+            for index in table.indexes:
+                conn.execute(CreateIndex(index, if_not_exists=True))
+
+# Partition teams and matches by championship, moving existing rows into championship 1
+def _add_championships(engine):
+    inspector = inspect(engine)
+    tables = inspector.get_table_names()
+
+    with engine.begin() as conn:
+        for table in ("teams", "matches"):
+            columns = {column["name"] for column in inspector.get_columns(table)}
+            if "championship_id" not in columns:
+                conn.execute(text(
+                    f"ALTER TABLE {table} ADD COLUMN championship_id INTEGER NOT NULL DEFAULT 1 REFERENCES championships(id)"
+                ))
+
+        # Team names used to be unique across the whole table
+        conn.execute(text("DROP INDEX IF EXISTS ix_teams_name"))
+
+        # Every database has at least the default championship
+        if conn.execute(text("SELECT COUNT(*) FROM championships")).scalar() == 0:
+            version = 0
+            if "data_version" in tables:
+                version = conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM data_version")).scalar()
+            conn.execute(
+                text("INSERT INTO championships (id, name, group_count, group_capacity, archived, version) "
+                     "VALUES (1, 'Championship 1', 2, 6, 0, :version)"),
+                {"version": version},
+            )
+        conn.execute(text("DROP TABLE IF EXISTS data_version"))
+
+# Championships created before rulesets existed keep the default rules (NULL)
+def _add_championship_rules(engine):
+    columns = {column["name"] for column in inspect(engine).get_columns("championships")}
+    if "rules" not in columns:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE championships ADD COLUMN rules TEXT"))
+
+# Replace the team name columns on matches with team ids and a canonical (low id, high id) pair.
+# SQLite cannot alter columns in place, so the table is rebuilt.
+def _link_matches_to_teams(engine):
+    columns = {column["name"] for column in inspect(engine).get_columns("matches")}
+    if "team_a_id" in columns:
+        return
+
+    with engine.begin() as conn:
+        # Index names move with a renamed table and would clash with the new table's
+        indexes = conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'matches' AND sql IS NOT NULL"
+        )).scalars().all()
+        for index in indexes:
+            conn.execute(text(f"DROP INDEX {index}"))
+
+        conn.execute(text("ALTER TABLE matches RENAME TO matches_old"))
+        models.Match.__table__.create(conn)
+
+        # Matches naming unknown teams are dropped, as is any repeat of a pairing (the earliest match is kept)
+        conn.execute(text(
+            "INSERT OR IGNORE INTO matches "
+            "(id, championship_id, team_a_id, team_b_id, pair_low_id, pair_high_id, goals_a, goals_b) "
+            "SELECT m.id, m.championship_id, ta.id, tb.id, MIN(ta.id, tb.id), MAX(ta.id, tb.id), m.goals_a, m.goals_b "
+            "FROM matches_old m "
+            "JOIN teams ta ON ta.championship_id = m.championship_id AND ta.name = m.team_a "
+            "JOIN teams tb ON tb.championship_id = m.championship_id AND tb.name = m.team_b "
+            "ORDER BY m.id"
+        ))
+        conn.execute(text("DROP TABLE matches_old"))
+
+        # Dropped matches change the totals; an empty standings table is rebuilt on startup
+        conn.execute(text("DELETE FROM standings"))
+
+# Start the match history of databases that predate it with one event per existing match,
+# so replaying the events reproduces the current standings
+def _backfill_match_events(engine):
+    with engine.begin() as conn:
+        if conn.execute(text("SELECT EXISTS (SELECT 1 FROM match_events)")).scalar():
+            return
+        conn.execute(text(
+            "INSERT INTO match_events (championship_id, match_id, team_a_id, team_b_id, goals_a, goals_b) "
+            "SELECT championship_id, id, team_a_id, team_b_id, goals_a, goals_b FROM matches ORDER BY id"
+        ))
+
+# Start the change feed of databases that predate it with one insert per existing team and match
+def _backfill_changes(engine):
+    with engine.begin() as conn:
+        if conn.execute(text("SELECT EXISTS (SELECT 1 FROM changes)")).scalar():
+            return
+        conn.execute(text(
+            "INSERT INTO changes (championship_id, kind, op, row_id, row) "
+            "SELECT championship_id, 'team', 'insert', id, json_object("
+            "'id', id, 'name', name, 'registration_date', registration_date, 'group_number', group_number) "
+            "FROM teams ORDER BY id"
+        ))
+        conn.execute(text(
+            "INSERT INTO changes (championship_id, kind, op, row_id, row) "
+            "SELECT m.championship_id, 'match', 'insert', m.id, json_object("
+            "'id', m.id, 'team_a_id', m.team_a_id, 'team_b_id', m.team_b_id, 'team_a', a.name, 'team_b', b.name, "
+            "'goals_a', m.goals_a, 'goals_b', m.goals_b) "
+            "FROM matches m JOIN teams a ON a.id = m.team_a_id JOIN teams b ON b.id = m.team_b_id ORDER BY m.id"
+        ))
+
+# Trigram full-text index over team names for /teams/search, kept in step with the teams table by triggers.
+# SQLite builds without FTS5 skip it, and search falls back to the name index.
+def _add_team_search(engine):
+    if "teams_fts" in inspect(engine).get_table_names():
+        return
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE VIRTUAL TABLE teams_fts USING fts5(name, content='teams', content_rowid='id', tokenize='trigram')"
+            ))
+            conn.execute(text(
+                "CREATE TRIGGER teams_fts_insert AFTER INSERT ON teams BEGIN "
+                "INSERT INTO teams_fts (rowid, name) VALUES (new.id, new.name); END"
+            ))
+            conn.execute(text(
+                "CREATE TRIGGER teams_fts_delete AFTER DELETE ON teams BEGIN "
+                "INSERT INTO teams_fts (teams_fts, rowid, name) VALUES ('delete', old.id, old.name); END"
+            ))
+            conn.execute(text(
+                "CREATE TRIGGER teams_fts_update AFTER UPDATE OF name ON teams BEGIN "
+                "INSERT INTO teams_fts (teams_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+                "INSERT INTO teams_fts (rowid, name) VALUES (new.id, new.name); END"
+            ))
+            conn.execute(text("INSERT INTO teams_fts (teams_fts) VALUES ('rebuild')"))
+    except OperationalError:
+        pass
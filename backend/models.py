@@ -1,19 +1,132 @@
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Boolean, Column, Integer, String, Text, ForeignKey, Index, func
+from sqlalchemy.orm import relationship
 from .database import Base
+from .ranking import load_rules
+
+# A competition; every team and match belongs to exactly one championship
+class Championship(Base):
+    __tablename__ = "championships"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False)
+    group_count = Column(Integer, nullable=False, default=2)
+    group_capacity = Column(Integer, nullable=False, default=6)
+    archived = Column(Boolean, nullable=False, default=False)
+    version = Column(Integer, nullable=False, default=0)  # bumped by every write, versions /rankings/
+    rules_json = Column("rules", Text)  # ranking.Ruleset as JSON; NULL for the default rules
+
+    @property
+    def rules(self):
+        return load_rules(self.rules_json)
 
 class Team(Base):
     __tablename__ = "teams"
+    __table_args__ = (
+        Index("ix_teams_championship_group", "championship_id", "group_number"),
+        Index("ix_teams_championship_name", "championship_id", "name", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, unique=True, index=True)
+    championship_id = Column(Integer, ForeignKey("championships.id"), nullable=False)
+    name = Column(String, nullable=False)
     registration_date = Column(String, nullable=False)
     group_number = Column(Integer, nullable=False)
 
+# Case-insensitive name prefix lookups for short /teams/search queries
+Index("ix_teams_championship_lower_name", Team.championship_id, func.lower(Team.name))
+
 class Match(Base):
     __tablename__ = "matches"
+    __table_args__ = (
+        Index("ix_matches_championship_team_a", "championship_id", "team_a_id"),
+        Index("ix_matches_championship_team_b", "championship_id", "team_b_id"),
+        # One match per pair of teams, whichever side each was entered on
+        Index("ix_matches_pair", "pair_low_id", "pair_high_id", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    team_a = Column(String, nullable=False)
-    team_b = Column(String, nullable=False)
+    championship_id = Column(Integer, ForeignKey("championships.id"), nullable=False)
+    team_a_id = Column(Integer, ForeignKey("teams.id"), nullable=False)
+    team_b_id = Column(Integer, ForeignKey("teams.id"), nullable=False)
+    pair_low_id = Column(Integer, nullable=False)  # min(team_a_id, team_b_id)
+    pair_high_id = Column(Integer, nullable=False)  # max(team_a_id, team_b_id)
     goals_a = Column(Integer, nullable=False)
     goals_b = Column(Integer, nullable=False)
+
+    team_a_ref = relationship("Team", foreign_keys=[team_a_id], lazy="joined")
+    team_b_ref = relationship("Team", foreign_keys=[team_b_id], lazy="joined")
+
+    # Team names are read through the references, so renaming a team touches one row
+    @property
+    def team_a(self):
+        return self.team_a_ref.name
+
+    @property
+    def team_b(self):
+        return self.team_b_ref.name
+
+    def set_teams(self, team_a_id: int, team_b_id: int):
+        self.team_a_id = team_a_id
+        self.team_b_id = team_b_id
+        self.pair_low_id = min(team_a_id, team_b_id)
+        self.pair_high_id = max(team_a_id, team_b_id)
+
+# Materialized standings, kept in step with matches by the crud layer
+class Standing(Base):
+    __tablename__ = "standings"
+
+    team_id = Column(Integer, ForeignKey("teams.id"), primary_key=True)
+    match_points = Column(Integer, nullable=False, default=0)
+    goals_scored = Column(Integer, nullable=False, default=0)
+    alternate_points = Column(Integer, nullable=False, default=0)
+    registration_key = Column(Integer, nullable=False)  # MMDD, sortable form of registration_date
+
+# Append-only record of every match write. An update keeps the previous teams and score,
+# so replaying the events in seq order rebuilds the standings at any point in time.
+class MatchEvent(Base):
+    __tablename__ = "match_events"
+    __table_args__ = (
+        Index("ix_match_events_championship_seq", "championship_id", "seq"),
+        {"sqlite_autoincrement": True},  # seqs are never reused, even after a championship is cleared
+    )
+
+    seq = Column(Integer, primary_key=True)
+    championship_id = Column(Integer, ForeignKey("championships.id"), nullable=False)
+    match_id = Column(Integer, nullable=False)
+    team_a_id = Column(Integer, nullable=False)
+    team_b_id = Column(Integer, nullable=False)
+    goals_a = Column(Integer, nullable=False)
+    goals_b = Column(Integer, nullable=False)
+    # Set on updates only: the result the event replaces
+    prev_team_a_id = Column(Integer)
+    prev_team_b_id = Column(Integer)
+    prev_goals_a = Column(Integer)
+    prev_goals_b = Column(Integer)
+
+# Standings of a championship as they stood after event_seq, so point-in-time rankings replay only the tail
+class StandingsCheckpoint(Base):
+    __tablename__ = "standings_checkpoints"
+    __table_args__ = (
+        Index("ix_standings_checkpoints_championship_seq", "championship_id", "event_seq"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    championship_id = Column(Integer, ForeignKey("championships.id"), nullable=False)
+    event_seq = Column(Integer, nullable=False)
+    totals = Column(Text, nullable=False)  # JSON {team_id: [match_points, goals_scored, alternate_points]}
+
+# Feed of row changes per championship for incremental client sync (/changes). Every team and match
+# write appends the row as written; a clear replaces the championship's feed with a single "clear" change.
+class Change(Base):
+    __tablename__ = "changes"
+    __table_args__ = (
+        Index("ix_changes_championship_seq", "championship_id", "seq"),
+        {"sqlite_autoincrement": True},  # seqs keep increasing across clears
+    )
+
+    seq = Column(Integer, primary_key=True)
+    championship_id = Column(Integer, ForeignKey("championships.id"), nullable=False)
+    kind = Column(String, nullable=False)  # "team", "match", or "championship" for a clear
+    op = Column(String, nullable=False)  # "insert", "update" or "clear"
+    row_id = Column(Integer)  # team or match id
+    row = Column(Text)  # JSON of the row as written
@@ -0,0 +1,280 @@
+import asyncio
+import atexit
+import json
+import multiprocessing
+from collections import defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from itertools import combinations, groupby
+from operator import attrgetter
+import numpy as np
+from .config import PROJECTION_WORKERS, PROJECTION_CHUNK_SIZE
+
+# Criteria a ruleset can order a group by. head_to_head compares teams still tied on every criterion before
+# it by a mini-league of the matches among them: match points, then goals scored in those matches.
+CRITERIA = ("match_points", "goals_scored", "alternate_points", "head_to_head", "registration_date")
+
+# Ranking rules of a championship: (win, draw, loss) match points and alternate points, the criteria that
+# order each group (best first; team id settles any tie left) and the number of teams per group that qualify
+Ruleset = namedtuple("Ruleset", "points alternate_points tiebreakers top_n")
+
+# The rules of championships created without their own, shared by /rankings/ and the qualification projections:
+# 3/1/0 match points, then goals scored, then 5/3/1 alternate points, then earliest registration date; top 4 qualify.
+DEFAULT_RULES = Ruleset((3, 1, 0), (5, 3, 1), ("match_points", "goals_scored", "alternate_points", "registration_date"), 4)
+
+# Goals per team per match assumed before any match has been played
+DEFAULT_GOALS_PER_MATCH = 1.35
+
+# Ruleset stored as JSON on a championship (empty for the default rules), parsed once per distinct ruleset
+@lru_cache(maxsize=None)
+def load_rules(rules_json):
+    if not rules_json:
+        return DEFAULT_RULES
+    rules = json.loads(rules_json)
+    return Ruleset(tuple(rules["points"]), tuple(rules["alternate_points"]), tuple(rules["tiebreakers"]), rules["top_n"])
+
+# JSON to store for a Ruleset or schemas.Ruleset (None for the default rules)
+def dump_rules(rules):
+    if rules is None:
+        return None
+    rules = Ruleset(tuple(rules.points), tuple(rules.alternate_points), tuple(rules.tiebreakers), rules.top_n)
+    return None if rules == DEFAULT_RULES else json.dumps(rules._asdict())
+
+# Standing attribute each sortable criterion reads, and whether a higher value ranks first
+SORT_COLUMNS = {
+    "match_points": ("match_points", True),
+    "goals_scored": ("goals_scored", True),
+    "alternate_points": ("alternate_points", True),
+    "registration_date": ("registration_key", False),
+}
+
+# A ruleset compiled into sort keys over RankedTeam rows (lower sorts first): key_before covers the criteria
+# ahead of head_to_head (all of them without it) and key_after the rest, ending with the team id.
+# columns_before/columns_after list the same criteria as (attribute, higher first) for SQL and numpy.
+CompiledRules = namedtuple("CompiledRules", "key_before key_after head_to_head columns_before columns_after")
+
+@lru_cache(maxsize=None)
+def compile_rules(rules: Ruleset):
+    criteria = list(rules.tiebreakers)
+    split = criteria.index("head_to_head") if "head_to_head" in criteria else len(criteria)
+    before = tuple(SORT_COLUMNS[criterion] for criterion in criteria[:split])
+    after = tuple(SORT_COLUMNS[criterion] for criterion in criteria[split + 1:])
+    return CompiledRules(_sort_key(before), _sort_key(after + (("id", False),)), split < len(criteria), before, after)
+
+def _sort_key(columns):
+    if not columns:
+        return lambda row: ()
+    get = attrgetter(*[attribute for attribute, _ in columns])
+    signs = [-1 if higher else 1 for _, higher in columns]
+    if len(columns) == 1:
+        return lambda row: (signs[0] * get(row),)
+    return lambda row: tuple(sign * value for sign, value in zip(signs, get(row)))
+
+# Sortable form of a DD/MM registration date (MMDD)
+def registration_key(registration_date: str):
+    date = datetime.strptime(registration_date, "%d/%m")
+    return date.month * 100 + date.day
+
+# Match points and alternate points earned by each side of a match
+def match_result_points(goals_a: int, goals_b: int, rules: Ruleset):
+    (win, draw, loss), (alt_win, alt_draw, alt_loss) = rules.points, rules.alternate_points
+    if goals_a > goals_b:  # Team A wins
+        return (win, alt_win), (loss, alt_loss)
+    if goals_a < goals_b:  # Team B wins
+        return (loss, alt_loss), (win, alt_win)
+    return (draw, alt_draw), (draw, alt_draw)  # Draw
+
+# Accumulate a match's contribution per team id into [match points, goals, alternate points] (sign=-1 reverts it)
+def add_match_totals(totals, team_a_id: int, team_b_id: int, goals_a: int, goals_b: int, rules: Ruleset, sign: int = 1):
+    points_a, points_b = match_result_points(goals_a, goals_b, rules)
+    for team_id, goals, (match_points, alternate_points) in ((team_a_id, goals_a, points_a), (team_b_id, goals_b, points_b)):
+        total = totals.setdefault(team_id, [0, 0, 0])
+        total[0] += sign * match_points
+        total[1] += sign * goals
+        total[2] += sign * alternate_points
+
+# One team's standing and its 1-based position within its group
+RankedTeam = namedtuple("RankedTeam", (
+    "id", "name", "group_number", "registration_date",
+    "match_points", "goals_scored", "alternate_points", "registration_key", "position",
+))
+
+# Rank (team, standing) rows within each group, returning RankedTeam rows ordered by group, then position.
+# results are the (team_a_id, team_b_id, goals_a, goals_b) matches, needed when the rules use head_to_head.
+# The SQL backend sorts by the same criteria with a window function (crud.get_ranked_standings).
+def rank_standings(rows, rules: Ruleset, results=()):
+    compiled = compile_rules(rules)
+    ranked = sorted((
+        RankedTeam(
+            team.id, team.name, team.group_number, team.registration_date,
+            standing.match_points, standing.goals_scored, standing.alternate_points, standing.registration_key, 0,
+        )
+        for team, standing in rows
+    ), key=lambda row: (row.group_number, compiled.key_before(row), compiled.key_after(row)))
+    if compiled.head_to_head:
+        return apply_head_to_head(ranked, results, rules)
+    return _number_positions(ranked)
+
+# Reorder ranked rows (ordered by group, then by the criteria ahead of head_to_head) within each cluster of
+# teams tied on those criteria by their mini-league among themselves, then by the criteria after it.
+# Only tied clusters look at the results; a ruleset without head_to_head leaves the rows as they are.
+def apply_head_to_head(ranked, results, rules: Ruleset):
+    compiled = compile_rules(rules)
+    if not compiled.head_to_head:
+        return ranked
+    reordered, results_by_pair = [], None
+    for _, cluster in groupby(ranked, key=lambda row: (row.group_number, compiled.key_before(row))):
+        cluster = list(cluster)
+        if len(cluster) > 1:
+            if results_by_pair is None:
+                results_by_pair = {(team_a_id, team_b_id): (goals_a, goals_b) for team_a_id, team_b_id, goals_a, goals_b in results}
+            table = _mini_league([row.id for row in cluster], results_by_pair, rules)
+            cluster.sort(key=lambda row: (-table[row.id][0], -table[row.id][1]) + compiled.key_after(row))
+        reordered.extend(cluster)
+    return _number_positions(reordered)
+
+# [match points, goals scored] of each team over the matches among team_ids only
+def _mini_league(team_ids, results_by_pair, rules):
+    table = {team_id: [0, 0] for team_id in team_ids}
+    for a, b in combinations(team_ids, 2):
+        for team_a_id, team_b_id in ((a, b), (b, a)):
+            if (team_a_id, team_b_id) in results_by_pair:
+                goals_a, goals_b = results_by_pair[(team_a_id, team_b_id)]
+                (points_a, _), (points_b, _) = match_result_points(goals_a, goals_b, rules)
+                table[team_a_id][0] += points_a
+                table[team_a_id][1] += goals_a
+                table[team_b_id][0] += points_b
+                table[team_b_id][1] += goals_b
+    return table
+
+def _number_positions(ranked):
+    numbered, position, previous_group = [], 0, None
+    for row in ranked:
+        position = position + 1 if row.group_number == previous_group else 1
+        previous_group = row.group_number
+        numbered.append(row._replace(position=position))
+    return numbered
+
+# Split ranked rows (ordered by group, then position) into {group_number: [row, ...]}
+def group_ranked(rows):
+    groups = defaultdict(list)
+    for row in rows:
+        groups[row.group_number].append(row)
+    return dict(groups)
+
+# Remaining fixtures of a group: every pair of its teams that has not played yet
+def unplayed_fixtures(team_ids, played_pairs):
+    return [(a, b) for a, b in combinations(sorted(team_ids), 2) if (a, b) not in played_pairs]
+
+# Order the teams of every simulation by (simulations, teams) keys, most significant first and higher
+# ranking first, with one stable argsort per key from the least significant up
+def _order_by_keys(keys, shape):
+    order = np.broadcast_to(np.arange(shape[1]), shape)
+    for key in reversed(keys):
+        values = np.take_along_axis(np.broadcast_to(key, shape), order, axis=1)
+        order = np.take_along_axis(order, np.argsort(-values, axis=1, kind="stable"), axis=1)
+    return order
+
+# Simulate the remaining fixtures of one group `simulations` times and count top-N finishes per team.
+# current is a (teams, 3) array of match points, goals scored and alternate points; registration_rank and
+# id_rank are each team's position by registration date (then id) and by id; played holds the group's
+# results as (team_a, team_b, goals_a, goals_b) rows, for head_to_head. Teams are indexes into the team axis.
+def simulate_group(current, registration_rank, id_rank, played, fixtures, goals_per_match, simulations, seed, rules):
+    teams = len(current)
+    counts = np.zeros(teams, dtype=np.int64)
+    if teams == 0 or simulations == 0:
+        return counts
+
+    rng = np.random.default_rng(seed)
+    fixtures = np.asarray(fixtures, dtype=np.int64).reshape(-1, 2)
+    side_a = np.zeros((len(fixtures), teams), dtype=np.int64)
+    side_b = np.zeros((len(fixtures), teams), dtype=np.int64)
+    side_a[np.arange(len(fixtures)), fixtures[:, 0]] = 1
+    side_b[np.arange(len(fixtures)), fixtures[:, 1]] = 1
+
+    # (simulations, fixtures) scorelines
+    goals_a = rng.poisson(goals_per_match, size=(simulations, len(fixtures)))
+    goals_b = rng.poisson(goals_per_match, size=(simulations, len(fixtures)))
+    win_a, win_b = goals_a > goals_b, goals_a < goals_b
+    draw = ~(win_a | win_b)
+
+    # Apply the same point scheme as match_result_points to every simulated match at once
+    (win, draw_points, loss), (alt_win, alt_draw, alt_loss) = rules.points, rules.alternate_points
+    points_a = win * win_a + draw_points * draw + loss * win_b
+    points_b = win * win_b + draw_points * draw + loss * win_a
+    alt_a = alt_win * win_a + alt_draw * draw + alt_loss * win_b
+    alt_b = alt_win * win_b + alt_draw * draw + alt_loss * win_a
+
+    # (simulations, teams) final totals
+    values = {
+        "match_points": current[:, 0] + points_a @ side_a + points_b @ side_b,
+        "goals_scored": current[:, 1] + goals_a @ side_a + goals_b @ side_b,
+        "alternate_points": current[:, 2] + alt_a @ side_a + alt_b @ side_b,
+        "registration_key": np.asarray(registration_rank, dtype=np.int64),
+        "id": np.asarray(id_rank, dtype=np.int64),
+    }
+    compiled = compile_rules(rules)
+    before = [values[attribute] if higher else -values[attribute] for attribute, higher in compiled.columns_before]
+    after = [values[attribute] if higher else -values[attribute] for attribute, higher in compiled.columns_after + (("id", False),)]
+    shape = (simulations, teams)
+
+    head_to_head = []
+    if compiled.head_to_head:
+        # Mini-league points and goals per team: each result, real or simulated, counts in the simulations
+        # where both its teams are tied on every criterion ahead of head_to_head. Built one match at a time,
+        # so it needs no more than (simulations, teams) arrays.
+        keys = [np.broadcast_to(key, shape) for key in before]
+        results = [(team_a, team_b, *(points for points, _ in match_result_points(played_a, played_b, rules)), played_a, played_b)
+                   for team_a, team_b, played_a, played_b in played]
+        results += [(team_a, team_b, points_a[:, match], points_b[:, match], goals_a[:, match], goals_b[:, match])
+                    for match, (team_a, team_b) in enumerate(fixtures)]
+        league_points, league_goals = np.zeros(shape, dtype=np.int64), np.zeros(shape, dtype=np.int64)
+        for team_a, team_b, result_points_a, result_points_b, result_goals_a, result_goals_b in results:
+            tied = np.ones(simulations, dtype=bool)
+            for key in keys:
+                tied &= key[:, team_a] == key[:, team_b]
+            league_points[:, team_a] += result_points_a * tied
+            league_points[:, team_b] += result_points_b * tied
+            league_goals[:, team_a] += result_goals_a * tied
+            league_goals[:, team_b] += result_goals_b * tied
+        head_to_head = [league_points, league_goals]
+
+    top = _order_by_keys(before + head_to_head + after, shape)[:, :rules.top_n]
+    np.add.at(counts, top.ravel(), 1)
+    return counts
+
+_pool = None
+
+# Workers come from a forkserver rather than a fork of this process: by now it runs threads (the audit
+# listener, aiosqlite, to_thread workers) whose locks a forked child could inherit held
+def _get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=PROJECTION_WORKERS, mp_context=multiprocessing.get_context("forkserver"))
+        atexit.register(_pool.shutdown)
+    return _pool
+
+# Split a simulation count into chunks, each with an independent random stream
+def simulation_chunks(simulations, seed):
+    sizes = [PROJECTION_CHUNK_SIZE] * (simulations // PROJECTION_CHUNK_SIZE)
+    if simulations % PROJECTION_CHUNK_SIZE:
+        sizes.append(simulations % PROJECTION_CHUNK_SIZE)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    return list(zip(sizes, seeds))
+
+# Run a group's simulations and return its top-N counts per team, never on the event loop. A single chunk
+# (or PROJECTION_WORKERS=1) runs in a worker thread; larger runs are spread across the process pool so they
+# do not share the GIL either. group is the (current, registration_rank, id_rank, played) arguments of simulate_group.
+async def run_simulations(group, fixtures, goals_per_match, simulations, seed, rules):
+    chunks = simulation_chunks(simulations, seed)
+    if len(chunks) <= 1 or PROJECTION_WORKERS <= 1:
+        return await asyncio.to_thread(lambda: sum(simulate_group(*group, fixtures, goals_per_match, size, chunk_seed, rules)
+                                                   for size, chunk_seed in chunks))
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+    counts = await asyncio.gather(*(
+        loop.run_in_executor(pool, simulate_group, *group, fixtures, goals_per_match, size, chunk_seed, rules)
+        for size, chunk_seed in chunks
+    ))
+    return sum(counts)
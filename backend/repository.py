@@ -0,0 +1,325 @@
+import asyncio
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import crud
+
+# Raised by a write that conflicts with stored data: a team name or match pairing that already exists
+class ConflictError(Exception):
+    pass
+
+# Storage of championships, teams, matches, standings and match events. Every backend implements
+# the same synchronous methods; request handlers call them through `await repo.run(repo.method, ...)`
+# so a database backend can run them on its connection without blocking the event loop.
+class Repository(ABC):
+    # Run a function that uses this repository, translating write conflicts into ConflictError
+    async def run(self, fn, *args, **kwargs):
+        return fn(*args, **kwargs)
+
+    # Run blocking work that opens a repository of its own. The in-memory store is only touched from the
+    # event loop, so it runs inline there; a database backend runs it in a worker thread.
+    async def run_blocking(self, fn, *args):
+        return fn(*args)
+
+    # Make the reads within it see one consistent state. The in-memory store is only changed from the
+    # event loop, so synchronous reads on it already do.
+    @contextmanager
+    def read_transaction(self):
+        yield
+
+    # Reload a championship's details (its data version) after a write
+    async def refresh(self, championship):
+        pass
+
+    # Release whatever the repository holds while a request waits on something else
+    async def close(self):
+        pass
+
+    # Championships
+    @abstractmethod
+    def get_championship(self, championship_id: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_championship_version(self, championship_id: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_championships(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def create_championship(self, championship):
+        raise NotImplementedError
+
+    @abstractmethod
+    def archive_championship(self, championship):
+        raise NotImplementedError
+
+    # Teams
+    @abstractmethod
+    def get_team(self, championship_id: int, team_name: str):
+        raise NotImplementedError
+
+    # (id, name, group_number, registration_date) of every team, for the write validation index
+    @abstractmethod
+    def get_team_details(self, championship_id: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_teams(self, championship_id: int, columns, after_id: int = 0, limit: int = 100, group_number: int = None, name: str = None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def search_teams(self, championship_id: int, query: str, limit: int = 20):
+        raise NotImplementedError
+
+    # Writes return what they wrote together with the championship data version they committed
+    # (update_team only the version)
+    def create_team(self, championship_id: int, team):
+        created, version = self.create_teams(championship_id, [team])
+        return created[0], version
+
+    @abstractmethod
+    def create_teams(self, championship_id: int, teams):
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_team(self, championship_id: int, team_id: int, team):
+        raise NotImplementedError
+
+    # Matches
+    @abstractmethod
+    def get_match(self, championship_id: int, match_id: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_played_pairs(self, championship_id: int):
+        raise NotImplementedError
+
+    # (id, team_a, team_b, goals_a, goals_b, team_a_id, team_b_id) of every match, in id order
+    @abstractmethod
+    def get_match_rows(self, championship_id: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_team_matches(self, championship_id: int, team_id: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_matches(self, championship_id: int, columns, after_id: int = 0, limit: int = 100,
+                     group_number: int = None, team: str = None, goals_a: int = None, goals_b: int = None):
+        raise NotImplementedError
+
+    def create_match(self, championship_id: int, match, team_a, team_b):
+        created, version = self.create_matches(championship_id, [(match, team_a, team_b)])
+        return created[0], version
+
+    @abstractmethod
+    def create_matches(self, championship_id: int, entries):
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_match(self, db_match, match, team_a, team_b):
+        raise NotImplementedError
+
+    # Standings and match events
+    # ranking.RankedTeam-shaped rows of every team, ordered by group, then position within it by the
+    # ruleset's criteria except head_to_head (see ranking.apply_head_to_head)
+    @abstractmethod
+    def get_ranked_standings(self, championship_id: int, rules):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_standings_as_of(self, championship_id: int, as_of: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_matches_as_of(self, championship_id: int, as_of: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_match_events(self, championship_id: int, after_seq: int = 0, limit: int = 100):
+        raise NotImplementedError
+
+    # Hold off every other write until clear_championship commits
+    @abstractmethod
+    def lock_writes(self, championship_id: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    def clear_championship(self, championship_id: int):
+        raise NotImplementedError
+
+    # Change feed: (seq, kind, op, row) changes after seq `since`, and (last clear seq, newest seq)
+    @abstractmethod
+    def list_changes(self, championship_id: int, since: int = 0, limit: int = 100):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_change_bounds(self, championship_id: int):
+        raise NotImplementedError
+
+    # Chunks of at most `size` row dicts of a championship's "teams" (with standings) or "matches", for exports
+    @abstractmethod
+    def export_rows(self, kind: str, championship_id: int, size: int):
+        raise NotImplementedError
+
+    async def stream_rows(self, kind: str, championship_id: int, size: int):
+        for rows in self.export_rows(kind, championship_id, size):
+            yield rows
+
+# The SQLAlchemy backend: the crud helpers on a synchronous session, or on an async session for
+# request handlers, where run() executes them through AsyncSession.run_sync
+class SqlRepository(Repository):
+    def __init__(self, db):
+        self.async_db = db if isinstance(db, AsyncSession) else None
+        self.db = db.sync_session if self.async_db is not None else db
+
+    async def run(self, fn, *args, **kwargs):
+        try:
+            if self.async_db is None:
+                return fn(*args, **kwargs)
+            return await self.async_db.run_sync(lambda _: fn(*args, **kwargs))
+        except IntegrityError as e:
+            await self.rollback()
+            raise ConflictError(str(e.orig)) from e
+
+    async def rollback(self):
+        if self.async_db is not None:
+            await self.async_db.rollback()
+        else:
+            self.db.rollback()
+
+    async def run_blocking(self, fn, *args):
+        return await asyncio.to_thread(fn, *args)
+
+    # The SQLite drivers start no transaction for a SELECT, so each read would see the latest commit.
+    # An explicit one (unless a write already opened one) pins them all to one WAL snapshot.
+    @contextmanager
+    def read_transaction(self):
+        connection = self.db.connection()
+        if connection.connection.driver_connection.in_transaction:
+            yield
+            return
+        connection.exec_driver_sql("BEGIN")
+        try:
+            yield
+        finally:
+            connection.exec_driver_sql("COMMIT")
+
+    async def refresh(self, championship):
+        if self.async_db is not None:
+            await self.async_db.refresh(championship)
+        else:
+            self.db.refresh(championship)
+
+    async def close(self):
+        if self.async_db is not None:
+            await self.async_db.close()
+
+    def get_championship(self, championship_id):
+        return crud.get_championship(self.db, championship_id)
+
+    def get_championship_version(self, championship_id):
+        return crud.get_championship_version(self.db, championship_id)
+
+    def get_championships(self):
+        return crud.get_championships(self.db)
+
+    def create_championship(self, championship):
+        return crud.create_championship(self.db, championship)
+
+    def archive_championship(self, championship):
+        return crud.archive_championship(self.db, championship)
+
+    def get_team(self, championship_id, team_name):
+        return crud.get_team(self.db, championship_id, team_name)
+
+    def get_team_details(self, championship_id):
+        return crud.get_team_details(self.db, championship_id)
+
+    def list_teams(self, championship_id, columns, after_id=0, limit=100, group_number=None, name=None):
+        return crud.list_teams(self.db, championship_id, columns, after_id, limit, group_number=group_number, name=name)
+
+    def search_teams(self, championship_id, query, limit=20):
+        return crud.search_teams(self.db, championship_id, query, limit)
+
+    def create_team(self, championship_id, team):
+        return crud.create_team(self.db, championship_id, team)
+
+    def create_teams(self, championship_id, teams):
+        return crud.create_teams(self.db, championship_id, teams)
+
+    def update_team(self, championship_id, team_id, team):
+        return crud.update_team(self.db, championship_id, team_id, team)
+
+    def get_match(self, championship_id, match_id):
+        return crud.get_match(self.db, championship_id, match_id)
+
+    def get_played_pairs(self, championship_id):
+        return crud.get_played_pairs(self.db, championship_id)
+
+    def get_match_rows(self, championship_id):
+        return crud.get_match_rows(self.db, championship_id)
+
+    def get_team_matches(self, championship_id, team_id):
+        return crud.get_team_matches(self.db, championship_id, team_id)
+
+    def list_matches(self, championship_id, columns, after_id=0, limit=100, group_number=None, team=None, goals_a=None, goals_b=None):
+        return crud.list_matches(self.db, championship_id, columns, after_id, limit,
+                                 group_number=group_number, team=team, goals_a=goals_a, goals_b=goals_b)
+
+    def create_match(self, championship_id, match, team_a, team_b):
+        return crud.create_match(self.db, championship_id, match, team_a, team_b)
+
+    def create_matches(self, championship_id, entries):
+        return crud.create_matches(self.db, championship_id, entries)
+
+    def update_match(self, db_match, match, team_a, team_b):
+        return crud.update_match(self.db, db_match, match, team_a, team_b)
+
+    def get_ranked_standings(self, championship_id, rules):
+        return crud.get_ranked_standings(self.db, championship_id, rules)
+
+    def get_standings_as_of(self, championship_id, as_of):
+        return crud.get_standings_as_of(self.db, championship_id, as_of)
+
+    def get_matches_as_of(self, championship_id, as_of):
+        return crud.get_matches_as_of(self.db, championship_id, as_of)
+
+    def list_match_events(self, championship_id, after_seq=0, limit=100):
+        return crud.list_match_events(self.db, championship_id, after_seq, limit)
+
+    def lock_writes(self, championship_id):
+        return crud.lock_writes(self.db, championship_id)
+
+    def clear_championship(self, championship_id):
+        return crud.clear_championship(self.db, championship_id)
+
+    def list_changes(self, championship_id, since=0, limit=100):
+        return crud.list_changes(self.db, championship_id, since, limit)
+
+    def get_change_bounds(self, championship_id):
+        return crud.get_change_bounds(self.db, championship_id)
+
+    # Rows are read through a server-side cursor, `size` at a time
+    def export_rows(self, kind, championship_id, size):
+        result = self.db.execute(_export_statement(kind, championship_id).execution_options(yield_per=size))
+        for rows in result.partitions():
+            yield [row._asdict() for row in rows]
+
+    async def stream_rows(self, kind, championship_id, size):
+        if self.async_db is None:
+            async for rows in super().stream_rows(kind, championship_id, size):
+                yield rows
+            return
+        result = await self.async_db.stream(_export_statement(kind, championship_id).execution_options(yield_per=size))
+        async for rows in result.partitions():
+            yield [row._asdict() for row in rows]
+
+def _export_statement(kind, championship_id):
+    if kind == "teams":
+        return crud.export_teams_statement(championship_id)
+    return crud.export_matches_statement(championship_id)
@@ -1,5 +1,31 @@
+from typing import List, Optional
 from pydantic import BaseModel
 
+# Ranking rules of a championship (see ranking.Ruleset); the defaults are the rules used so far
+class Ruleset(BaseModel):
+    points: List[int] = [3, 1, 0]  # match points for a win, draw and loss
+    alternate_points: List[int] = [5, 3, 1]
+    tiebreakers: List[str] = ["match_points", "goals_scored", "alternate_points", "registration_date"]
+    top_n: int = 4  # teams per group that qualify
+    class Config:
+        orm_mode = True
+
+class ChampionshipBase(BaseModel):
+    name: str
+    group_count: int = 2
+    group_capacity: int = 6
+
+class ChampionshipCreate(ChampionshipBase):
+    rules: Optional[Ruleset] = None
+
+class Championship(ChampionshipBase):
+    id: int
+    archived: bool
+    version: int
+    rules: Ruleset
+    class Config:
+        orm_mode = True
+
 class TeamBase(BaseModel):
     name: str
     registration_date: str
@@ -10,6 +36,7 @@ class TeamCreate(TeamBase):
 
 class Team(TeamBase):
     id: int
+    championship_id: int
     class Config:
         orm_mode = True
 
@@ -24,5 +51,70 @@ class MatchCreate(MatchBase):
 
 class Match(MatchBase):
     id: int
+    championship_id: int
     class Config:
         orm_mode = True
+
+class TeamBulkCreate(BaseModel):
+    teams: List[TeamCreate]
+    atomic: bool = True  # all-or-nothing; False accepts the valid rows only
+
+class MatchBulkCreate(BaseModel):
+    matches: List[MatchCreate]
+    atomic: bool = True  # all-or-nothing; False accepts the valid rows only
+
+class BulkRowResult(BaseModel):
+    index: int
+    accepted: bool
+    detail: str
+
+class BulkResult(BaseModel):
+    committed: bool
+    results: List[BulkRowResult]
+
+class ImportResult(BaseModel):
+    teams_added: int
+    matches_added: int
+    rejected: int
+    errors: List[BulkRowResult]  # the first rejected rows, index being the line number
+
+class Page(BaseModel):
+    items: List[dict]
+    next_after_id: Optional[int]  # pass as after_id to fetch the next page; None on the last page
+
+class LogPage(BaseModel):
+    entries: List[dict]
+    next_after_seq: int  # pass as after_seq to continue reading
+    last_seq: int  # newest record written so far
+
+class ChangePage(BaseModel):
+    changes: List[dict]  # {seq, kind, op, row}, oldest first
+    next_since: int  # pass as since to continue reading
+    last_seq: int  # newest change so far
+    resync_required: bool  # the championship was cleared after `since`: drop every local row first
+
+class TeamRanking(BaseModel):
+    team_name: str
+    match_points: int
+    goals_scored: int
+    alternate_points: int
+    registration_date: str
+    group_number: int
+
+class MatchResult(BaseModel):
+    id: int
+    team_a: str
+    team_b: str
+    goals_a: int
+    goals_b: int
+
+class TopTeam(BaseModel):
+    team_name: str
+
+# /rankings/ body. Every group also has a top_4_group_<n> list of TopTeam; include= can leave sections out.
+class Rankings(BaseModel):
+    as_of: Optional[int] = None  # only on point-in-time rankings
+    rankings: Optional[List[TeamRanking]] = None
+    matches: Optional[List[MatchResult]] = None
+    class Config:
+        extra = "allow"
@@ -0,0 +1,105 @@
+import asyncio
+from collections import namedtuple
+from . import ranking
+from .storage import open_async_repository
+
+# One match as it stood in a snapshot
+MatchRow = namedtuple("MatchRow", "id team_a team_b goals_a goals_b team_a_id team_b_id")
+
+# Immutable view of one championship at a data version: its ranking rules, its teams ranked within their
+# groups, with their standings, and every match. Readers share it without going back to the database; a write replaces it
+# with a new one instead of changing it, so a reader never sees half of a write.
+class Snapshot:
+    __slots__ = ("championship_id", "version", "group_count", "rules", "ranked", "matches", "derived")
+
+    def __init__(self, championship_id, version, group_count, rules, ranked, matches):
+        self.championship_id = championship_id
+        self.version = version
+        self.group_count = group_count
+        self.rules = rules  # ranking.Ruleset
+        self.ranked = ranked  # tuple of ranking.RankedTeam, ordered by group, then position
+        self.matches = matches  # tuple of MatchRow, in id order
+        self.derived = {}  # results computed from this snapshot (rankings bodies, projections), made once per key
+
+    # Remaining fixtures are every pairing not in here
+    @property
+    def played_pairs(self):
+        return {(min(match.team_a_id, match.team_b_id), max(match.team_a_id, match.team_b_id)) for match in self.matches}
+
+# Read a championship's snapshot through the repository. The version, standings and matches are read in
+# one read transaction, so a write committing meanwhile cannot mix two versions into the snapshot.
+def build_snapshot(repo, championship):
+    rules = championship.rules
+    with repo.read_transaction():
+        version = repo.get_championship_version(championship.id)
+        ranked = [ranking.RankedTeam(*row) for row in repo.get_ranked_standings(championship.id, rules)]
+        matches = tuple(MatchRow(*row) for row in repo.get_match_rows(championship.id))
+    results = ((match.team_a_id, match.team_b_id, match.goals_a, match.goals_b) for match in matches)
+    ranked = ranking.apply_head_to_head(ranked, results, rules)
+    return Snapshot(championship.id, version, championship.group_count, rules, tuple(ranked), matches)
+
+# Latest snapshot per championship in this process. A snapshot is swapped in with a single dict assignment,
+# so readers always get a complete one. After a write commits, the next snapshot is built in the background
+# on its own repository, so the write's response does not wait for it; writes landing while a build runs
+# are folded into one more build. Snapshots nobody read since the last swap are left for the next reader
+# to build, so a burst of writes with no one watching costs nothing extra.
+class SnapshotStore:
+    def __init__(self):
+        self.current = {}  # championship id -> Snapshot
+        self.builds = {}  # championship id -> task building the snapshot after the latest writes
+        self.stale = set()  # championships written again while their build was running
+        self.wanted = set()  # championships whose snapshot was read since it was last swapped
+        self.on_swap = None  # called with each snapshot swapped in by a background build
+
+    # Snapshot of at least the championship's version. A reader that is ahead of the current snapshot
+    # waits for the build in progress, or builds one on its own repository (another process wrote, or
+    # this process has not read the championship yet).
+    async def read(self, repo, championship):
+        self.wanted.add(championship.id)
+        snapshot = self.current.get(championship.id)
+        if snapshot is not None and snapshot.version >= championship.version:
+            return snapshot
+        build = self.builds.get(championship.id)
+        if build is not None and build.get_loop() is asyncio.get_running_loop():
+            # The build needs a connection of its own, so never hold one while waiting for it
+            await repo.close()
+            await asyncio.wait([build])
+            snapshot = self.current.get(championship.id)
+            if snapshot is not None and snapshot.version >= championship.version:
+                return snapshot
+        return await self._build(repo, championship)
+
+    # Start building a new snapshot after a committed write, if anyone reads it (eager: someone is waiting
+    # for it, such as an open stream)
+    def written(self, championship_id: int, eager: bool = False):
+        if championship_id not in self.wanted and not eager:
+            return
+        loop = asyncio.get_running_loop()
+        build = self.builds.get(championship_id)
+        if build is not None and not build.done() and build.get_loop() is loop:
+            self.stale.add(championship_id)
+        else:
+            self.builds[championship_id] = loop.create_task(self._rebuild(championship_id))
+
+    async def _rebuild(self, championship_id):
+        while True:
+            self.stale.discard(championship_id)
+            self.wanted.discard(championship_id)
+            async with open_async_repository() as repo:
+                championship = await repo.run(repo.get_championship, championship_id)
+                snapshot = await self._build(repo, championship)
+            if self.on_swap is not None:
+                self.on_swap(snapshot)
+            if championship_id not in self.stale:
+                return
+
+    async def _build(self, repo, championship):
+        snapshot = await repo.run(build_snapshot, repo, championship)
+        current = self.current.get(championship.id)
+        # Builds can finish out of order; never go back to an older version
+        if current is not None and current.version >= snapshot.version:
+            return current
+        self.current[championship.id] = snapshot
+        return snapshot
+
+snapshots = SnapshotStore()
@@ -0,0 +1,34 @@
+from contextlib import asynccontextmanager, contextmanager
+from .config import STORAGE_BACKEND
+from .database import SessionLocal, AsyncSessionLocal
+from .memory import MemoryRepository, MemoryStore
+from .repository import SqlRepository
+
+if STORAGE_BACKEND not in ("sqlite", "memory"):
+    raise ValueError(f"Unknown STORAGE_BACKEND {STORAGE_BACKEND!r}; expected 'sqlite' or 'memory'")
+
+# Data of the in-memory backend, shared by every request of this process
+memory_store = MemoryStore() if STORAGE_BACKEND == "memory" else None
+
+# Repository for code running on the event loop
+@asynccontextmanager
+async def open_async_repository():
+    if memory_store is not None:
+        yield MemoryRepository(memory_store)
+    else:
+        async with AsyncSessionLocal() as db:
+            yield SqlRepository(db)
+
+# Repository for worker threads and maintenance code
+@contextmanager
+def open_repository():
+    if memory_store is not None:
+        yield MemoryRepository(memory_store)
+    else:
+        with SessionLocal() as db:
+            yield SqlRepository(db)
+
+# Request-scoped repository of the configured backend
+async def get_repository():
+    async with open_async_repository() as repo:
+        yield repo
@@ -0,0 +1,165 @@
+from collections import Counter, namedtuple
+from datetime import datetime
+from fastapi import HTTPException
+from . import models, schemas
+from .ranking import CRITERIA
+
+# Check a championship's ranking rules: three point values per scheme, known criteria listed once each
+def validate_rules(rules: schemas.Ruleset):
+    if len(rules.points) != 3 or len(rules.alternate_points) != 3:
+        raise HTTPException(status_code=400, detail="points and alternate_points need 3 values: win, draw and loss.")
+    unknown = [criterion for criterion in rules.tiebreakers if criterion not in CRITERIA]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown tiebreakers: {', '.join(unknown)}. Expected some of {', '.join(CRITERIA)}.")
+    if len(set(rules.tiebreakers)) != len(rules.tiebreakers):
+        raise HTTPException(status_code=400, detail="Each tiebreaker can only be listed once.")
+    if rules.top_n < 1:
+        raise HTTPException(status_code=400, detail="top_n must be at least 1.")
+
+# Validate a team's registration date and group against the championship settings
+def validate_team_details(team: schemas.TeamCreate, championship: models.Championship):
+    # Validate date format
+    try:
+        datetime.strptime(team.registration_date, "%d/%m")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Expected DD/MM.")
+
+    # Validate group number
+    if not 1 <= team.group_number <= championship.group_count:
+        raise HTTPException(status_code=400, detail=f"Group number must be between 1 and {championship.group_count}.")
+
+# Check that a group still has room for one more team
+def validate_group_capacity(group_number: int, group_count: int, championship: models.Championship):
+    if group_count >= championship.group_capacity:
+        raise HTTPException(status_code=400, detail=f"Group {group_number} already has {championship.group_capacity} teams. No more teams can be added.")
+
+# Validate a new team against its group's current size and existing teams
+def validate_team(team: schemas.TeamCreate, championship: models.Championship, group_count: int, team_exists: bool):
+    validate_team_details(team, championship)
+    validate_group_capacity(team.group_number, group_count, championship)
+
+    if team_exists:
+        raise HTTPException(status_code=400, detail="Team already exists")
+
+# Check the parts of a match that need no database lookups
+def validate_match_input(match: schemas.MatchCreate):
+    # Check if team_a and team_b are different
+    if match.team_a == match.team_b:
+        raise HTTPException(status_code=400, detail="Team A and Team B must be different.")
+
+    if match.goals_a < 0 or match.goals_b < 0:
+        raise HTTPException(status_code=400, detail="Goals cannot be negative")
+
+# Validate a new match against the teams involved and whether they already played
+def validate_match(match: schemas.MatchCreate, team_a, team_b, already_played: bool = False):
+    # Check if team_a and team_b exist
+    if team_a is None:
+        raise HTTPException(status_code=400, detail=f"Team '{match.team_a}' not recognized")
+    if team_b is None:
+        raise HTTPException(status_code=400, detail=f"Team '{match.team_b}' not recognized")
+
+    # Ensure both teams are in the same group
+    if team_a.group_number != team_b.group_number:
+        raise HTTPException(status_code=400, detail=f"No cross-group matches allowed. Teams '{match.team_a}' and '{match.team_b}' are in different groups.")
+
+    # Matches count once regardless of which side a team was entered on
+    if already_played:
+        raise HTTPException(status_code=400, detail=f"A match between {match.team_a} and {match.team_b} already exists.")
+
+# Team details the write validators need; ids identify the played pairs
+IndexedTeam = namedtuple("IndexedTeam", "id name group_number registration_date")
+
+# In-memory view of the championship: teams by name, teams per group and played pairs
+class ChampionshipSnapshot:
+    def __init__(self, championship, teams, played, version=None):
+        self.championship = championship
+        self.teams = {team.name: team for team in teams}
+        self.group_counts = Counter(team.group_number for team in teams)
+        self.played = set(played)
+        self.version = version  # championship data version the snapshot reflects
+
+    @classmethod
+    def load(cls, repo, championship: models.Championship):
+        version = championship.version
+        teams = [IndexedTeam(*row) for row in repo.get_team_details(championship.id)]
+        return cls(championship, teams, repo.get_played_pairs(championship.id), version)
+
+    # Independent copy for validating a batch, so rejected rows never reach the shared index
+    def copy(self):
+        snapshot = ChampionshipSnapshot(self.championship, [], [], self.version)
+        snapshot.teams = dict(self.teams)
+        snapshot.group_counts = Counter(self.group_counts)
+        snapshot.played = set(self.played)
+        return snapshot
+
+    # Validate a team and, if it is accepted, count it towards the batch.
+    # Returns the team to insert.
+    def accept_team(self, team: schemas.TeamCreate):
+        validate_team(team, self.championship, self.group_counts[team.group_number], team.name in self.teams)
+        self.teams[team.name] = team
+        self.group_counts[team.group_number] += 1
+        return team
+
+    # Validate a new match without recording it, returning its two teams
+    def check_match(self, match: schemas.MatchCreate):
+        validate_match_input(match)
+        team_a, team_b = self.teams.get(match.team_a), self.teams.get(match.team_b)
+        validate_match(match, team_a, team_b, team_a is not None and team_b is not None and pair_of(team_a, team_b) in self.played)
+        return team_a, team_b
+
+    # Validate a match and, if it is accepted, record the pairing for the batch.
+    # Returns the (match, team_a, team_b) entry to insert.
+    def accept_match(self, match: schemas.MatchCreate):
+        team_a, team_b = self.check_match(match)
+        self.played.add(pair_of(team_a, team_b))
+        return match, team_a, team_b
+
+    # Write-through after committing, as version `committed`, a change validated against `version`.
+    # Unless the index was at `version` and the commit moved it exactly one step on, another write (from
+    # this or another process) got in between and the index is dropped so the next request reloads it.
+    def _advance(self, version, committed):
+        if self.version != version or committed != version + 1 or _indexes.get(self.championship.id) is not self:
+            _indexes.pop(self.championship.id, None)
+            return False
+        self.version = committed
+        return True
+
+    def added_teams(self, version, committed, db_teams):
+        if self._advance(version, committed):
+            for db_team in db_teams:
+                self.teams[db_team.name] = IndexedTeam(db_team.id, db_team.name, db_team.group_number, db_team.registration_date)
+                self.group_counts[db_team.group_number] += 1
+
+    def updated_team(self, version, committed, old: IndexedTeam, new: IndexedTeam):
+        if self._advance(version, committed):
+            del self.teams[old.name]
+            self.teams[new.name] = new
+            self.group_counts[old.group_number] -= 1
+            self.group_counts[new.group_number] += 1
+
+    def added_pairs(self, version, committed, pairs):
+        if self._advance(version, committed):
+            self.played.update(pairs)
+
+    def updated_pair(self, version, committed, old_pair, new_pair):
+        if self._advance(version, committed):
+            self.played.discard(old_pair)
+            self.played.add(new_pair)
+
+# Process-local, write-through index of each championship's snapshot. Every write bumps the
+# championship version in the database, so comparing it with the version each request already reads
+# keeps the index correct alongside other worker processes without extra queries.
+_indexes = {}
+
+# Get the championship's index, reloading it from the repository only when the data version moved on
+def get_index(repo, championship: models.Championship):
+    index = _indexes.get(championship.id)
+    if index is None or index.version != championship.version:
+        index = ChampionshipSnapshot.load(repo, championship)
+        _indexes[championship.id] = index
+    index.championship = championship
+    return index
+
+# Lower and higher team id of a pairing, as stored in the unique pair index
+def pair_of(team_a, team_b):
+    return min(team_a.id, team_b.id), max(team_a.id, team_b.id)
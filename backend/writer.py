@@ -0,0 +1,101 @@
+import asyncio
+from itertools import groupby
+from fastapi import HTTPException
+from . import schemas, validation
+from .repository import ConflictError
+from .storage import open_async_repository
+
+# Single writer committing queued team and match additions in groups (enabled by WRITE_QUEUE).
+# Rows are validated in arrival order against the championship index, and every run of consecutive
+# rows of one kind is inserted in a single transaction, so a burst of writes costs one commit per
+# run instead of one per request, and requests no longer compete for the SQLite write lock.
+class GroupCommitWriter:
+    def __init__(self, max_batch, wait_seconds, on_commit=None):
+        self.max_batch = max_batch
+        self.wait_seconds = wait_seconds  # extra time to gather a batch once the first row arrives
+        self.on_commit = on_commit  # awaited with (repo, championship) after a championship's rows commit
+        self.loop = None
+        self.queue = None
+        self.task = None
+
+    # Queue a TeamCreate or MatchCreate and wait until its batch has committed.
+    # Returns the created models.Team or models.Match, or raises the HTTPException rejecting the row.
+    async def submit(self, championship_id: int, row):
+        loop = asyncio.get_running_loop()
+        if self.task is None or self.task.done() or self.loop is not loop:
+            self.loop, self.queue = loop, asyncio.Queue()
+            self.task = loop.create_task(self._run())
+        future = loop.create_future()
+        await self.queue.put((championship_id, row, future))
+        return await future
+
+    async def _run(self):
+        while True:
+            batch = [await self.queue.get()]
+            if self.wait_seconds:
+                await asyncio.sleep(self.wait_seconds)
+            while len(batch) < self.max_batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            by_championship = {}
+            for entry in batch:
+                by_championship.setdefault(entry[0], []).append(entry)
+            for championship_id, entries in by_championship.items():
+                try:
+                    async with open_async_repository() as repo:
+                        await self._commit(repo, championship_id, entries)
+                except Exception as e:
+                    for _, _, future in entries:
+                        _reject(future, e)
+
+    async def _commit(self, repo, championship_id, entries):
+        championship = await repo.run(repo.get_championship, championship_id)
+        if championship is None or championship.archived:
+            for _, _, future in entries:
+                if championship is None:
+                    _reject(future, HTTPException(status_code=404, detail="Championship not found"))
+                else:
+                    _reject(future, HTTPException(status_code=409, detail=f"Championship '{championship.name}' is archived and read-only."))
+            return
+
+        ok = False  # whether any run committed
+        for is_team, run in groupby(entries, key=lambda entry: isinstance(entry[1], schemas.TeamCreate)):
+            # Validate against a copy, so rows rejected here never reach the shared index
+            index = await repo.run(validation.get_index, repo, championship)
+            accept = index.copy().accept_team if is_team else index.copy().accept_match
+            accepted = []
+            for _, row, future in run:
+                try:
+                    accepted.append((accept(row), future))
+                except HTTPException as e:
+                    _reject(future, e)
+            if not accepted:
+                continue
+
+            version = index.version
+            rows = [row for row, _ in accepted]
+            try:
+                created, committed = await repo.run(repo.create_teams if is_team else repo.create_matches, championship.id, rows)
+            except ConflictError:
+                # Another process wrote the same team or pairing first
+                await repo.refresh(championship)
+                kind = "team" if is_team else "match"
+                for _, future in accepted:
+                    _reject(future, HTTPException(status_code=409, detail=f"A {kind} was added concurrently. Please retry."))
+                continue
+
+            if is_team:
+                index.added_teams(version, committed, created)
+            else:
+                index.added_pairs(version, committed, [validation.pair_of(team_a, team_b) for _, team_a, team_b in rows])
+            for (_, future), db_row in zip(accepted, created):
+                if not future.done():
+                    future.set_result(db_row)
+            ok = True
+
+        if ok and self.on_commit is not None:
+            await self.on_commit(repo, championship)
+
+def _reject(future, error):
+    if not future.done():
+        future.set_exception(error)
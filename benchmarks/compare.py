@@ -0,0 +1,47 @@
+import argparse
+import json
+import sys
+
+# Latency and throughput columns compared between two runs, with whether a higher value is better
+METRICS = (("p50_ms", False), ("p95_ms", False), ("p99_ms", False), ("throughput_rps", True), ("sql_statements_mean", False))
+
+def change(before, after):
+    if before is None or after is None:
+        return None
+    if before == 0:
+        return 0.0 if after == 0 else None
+    return (after - before) / before * 100
+
+# Print the per-endpoint change from a baseline results file to a new one
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent change flagged as a regression")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)["endpoints"]
+    with open(args.candidate) as f:
+        candidate = json.load(f)["endpoints"]
+
+    regressions = 0
+    print(f"{'endpoint':<28}" + "".join(f"{metric:>22}" for metric, _ in METRICS))
+    for name in [name for name in baseline if name in candidate]:
+        cells = []
+        for metric, higher_is_better in METRICS:
+            before, after = baseline[name][metric], candidate[name][metric]
+            delta = change(before, after)
+            flag = ""
+            if delta is not None and (delta < -args.threshold if higher_is_better else delta > args.threshold):
+                flag = " !"
+                regressions += 1
+            cells.append(f"{after!s:>10} ({delta:+6.1f}%){flag:<2}" if delta is not None else f"{after!s:>20}  ")
+        print(f"{name:<28}" + "".join(cells))
+    for name in sorted(baseline.keys() ^ candidate.keys()):
+        print(f"{name:<28} only in {'baseline' if name in baseline else 'candidate'}")
+
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,48 @@
+import random
+from itertools import combinations
+
+# A synthetic championship: teams spread evenly over the groups, and a seeded share of each
+# group's pairings already played. The pairings left over are handed out to the write benchmarks.
+class SyntheticChampionship:
+    def __init__(self, teams, groups, matches, seed):
+        self.rng = random.Random(seed)
+        self.groups = groups
+        self.teams = [
+            {
+                "name": f"Team{i:04d}",
+                "registration_date": self.random_date(),
+                "group_number": 1 + i % groups,
+            }
+            for i in range(teams)
+        ]
+
+        pairs = []
+        for group_number in range(1, groups + 1):
+            names = [team["name"] for team in self.teams if team["group_number"] == group_number]
+            pairs.extend(combinations(names, 2))
+        self.rng.shuffle(pairs)
+        played, self.unplayed = pairs[:matches], pairs[matches:]
+        self.matches = [self.random_match(team_a, team_b) for team_a, team_b in played]
+        self.next_team = teams
+
+    # Group capacity that fits the generated teams plus `extra` more per group
+    def group_capacity(self, extra=0):
+        return -(-len(self.teams) // self.groups) + extra
+
+    def random_date(self):
+        return f"{self.rng.randint(1, 28):02d}/{self.rng.randint(1, 12):02d}"
+
+    def random_match(self, team_a, team_b):
+        return {"team_a": team_a, "team_b": team_b, "goals_a": self.rng.randint(0, 5), "goals_b": self.rng.randint(0, 5)}
+
+    # A team that has not been registered yet
+    def new_team(self):
+        team = {"name": f"Team{self.next_team:04d}", "registration_date": self.random_date(), "group_number": 1 + self.next_team % self.groups}
+        self.next_team += 1
+        return team
+
+    # A match between two teams that have not played each other yet, or None once every pairing is used
+    def new_match(self):
+        if not self.unplayed:
+            return None
+        return self.random_match(*self.unplayed.pop())
@@ -0,0 +1,303 @@
+import argparse
+import asyncio
+import atexit
+import contextvars
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+from .data import SyntheticChampionship
+
+# Statements issued on behalf of the request being timed. Each request runs in its own task, and the
+# app's thread pool and SQLAlchemy's greenlets inherit the task's context, so concurrent requests
+# never count each other's SQL.
+statement_counter = contextvars.ContextVar("statement_counter", default=None)
+
+def count_statement(conn, cursor, statement, parameters, context, executemany):
+    counter = statement_counter.get()
+    if counter is not None:
+        counter[0] += 1
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every backend endpoint against a synthetic championship.")
+    parser.add_argument("--teams", type=int, default=48, help="teams in the seeded championship")
+    parser.add_argument("--groups", type=int, default=4, help="groups in the seeded championship")
+    parser.add_argument("--matches", type=int, default=200, help="matches already played (capped by the available pairings)")
+    parser.add_argument("--seed", type=int, default=1, help="seed for the synthetic data")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=1, help="requests in flight at once; 1 runs them sequentially")
+    parser.add_argument("--bulk-size", type=int, default=10, help="rows per bulk request")
+    parser.add_argument("--simulations", type=int, default=1000, help="simulations per /rankings/projections request")
+    parser.add_argument("--storage", choices=["sqlite", "memory"], default="sqlite",
+                        help="backend storage; memory profiles the endpoint logic without the database")
+    parser.add_argument("--output", default="benchmark.json", help="where to write the JSON results")
+    parser.add_argument("--keep-db", action="store_true", help="keep the throwaway database directory")
+    return parser.parse_args(argv)
+
+# Nearest-rank percentile of sorted samples
+def percentile(samples, p):
+    if not samples:
+        return None
+    return samples[min(len(samples) - 1, max(0, round(p / 100 * len(samples)) - 1))]
+
+# Latencies, statement counts and failures collected for one endpoint
+class EndpointStats:
+    def __init__(self, method, path):
+        self.method = method
+        self.path = path
+        self.latencies = []
+        self.statements = []
+        self.errors = 0
+        self.elapsed = 0.0
+
+    def summary(self, concurrency):
+        latencies = sorted(self.latencies)
+        ms = lambda seconds: round(seconds * 1000, 3) if seconds is not None else None
+        return {
+            "method": self.method,
+            "path": self.path,
+            "requests": len(latencies),
+            "errors": self.errors,
+            "concurrency": concurrency,
+            "p50_ms": ms(percentile(latencies, 50)),
+            "p95_ms": ms(percentile(latencies, 95)),
+            "p99_ms": ms(percentile(latencies, 99)),
+            "mean_ms": ms(sum(latencies) / len(latencies)) if latencies else None,
+            "max_ms": ms(latencies[-1]) if latencies else None,
+            "throughput_rps": round(len(latencies) / self.elapsed, 2) if self.elapsed else None,
+            "sql_statements_mean": round(sum(self.statements) / len(self.statements), 2) if self.statements else None,
+            "sql_statements_max": max(self.statements) if self.statements else None,
+        }
+
+class Benchmark:
+    def __init__(self, client, args):
+        self.client = client
+        self.args = args
+        self.results = {}
+
+    # Issue one request, timing it and counting its SQL statements
+    async def timed(self, stats, method, url, expected=(200,), **kwargs):
+        counter = [0]
+        statement_counter.set(counter)
+        start = time.perf_counter()
+        response = await self.client.request(method, url, **kwargs)
+        stats.latencies.append(time.perf_counter() - start)
+        stats.statements.append(counter[0])
+        if response.status_code not in expected:
+            stats.errors += 1
+        return response
+
+    # Run step(i) for every request index, keeping `concurrency` of them in flight.
+    # A step may do untimed setup before calling timed().
+    async def scenario(self, name, method, path, step, requests=None):
+        stats = EndpointStats(method, path)
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+
+        async def bounded(i):
+            async with semaphore:
+                await step(stats, i)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(bounded(i) for i in range(requests or self.args.requests)))
+        stats.elapsed = time.perf_counter() - start
+        self.results[name] = stats.summary(self.args.concurrency)
+        print(f"{name:<40} p50 {self.results[name]['p50_ms']:>9} ms  p99 {self.results[name]['p99_ms']:>9} ms  "
+              f"{self.results[name]['throughput_rps']:>9} req/s  {self.results[name]['sql_statements_mean']:>6} SQL  "
+              f"{stats.errors} errors")
+
+    # Untimed request used for setup; fails loudly, since a broken setup makes every number meaningless
+    async def setup_request(self, method, url, **kwargs):
+        response = await self.client.request(method, url, **kwargs)
+        if response.status_code != 200:
+            raise RuntimeError(f"{method} {url} failed during setup: {response.status_code} {response.text}")
+        return response
+
+    async def create_championship(self, name, data, extra_capacity=0, matches=True):
+        championship = (await self.setup_request("POST", "/championships/", json={
+            "name": name, "group_count": data.groups, "group_capacity": max(data.group_capacity(extra_capacity), 2),
+        })).json()
+        scope = {"championship_id": championship["id"]}
+        for i in range(0, len(data.teams), 1000):
+            await self.setup_request("POST", "/teams/bulk", params=scope, json={"teams": data.teams[i:i + 1000]})
+        if matches:
+            for i in range(0, len(data.matches), 1000):
+                await self.setup_request("POST", "/matches/bulk", params=scope, json={"matches": data.matches[i:i + 1000]})
+        return championship
+
+    async def all_items(self, path, params):
+        items, after_id = [], 0
+        while after_id is not None:
+            page = (await self.setup_request("GET", path, params={**params, "after_id": after_id, "limit": 1000})).json()
+            items.extend(page["items"])
+            after_id = page["next_after_id"]
+        return items
+
+    async def run(self, main):
+        args = self.args
+        data = SyntheticChampionship(args.teams, args.groups, args.matches, args.seed)
+
+        # Leave room in every group for the teams the write benchmarks add
+        added_teams = args.requests * (1 + args.bulk_size)
+        start = time.perf_counter()
+        championship = await self.create_championship("Benchmark", data, extra_capacity=-(-added_teams // args.groups))
+        setup_seconds = time.perf_counter() - start
+        scope = {"championship_id": championship["id"]}
+        teams = data.teams
+        matches = await self.all_items("/matches/", scope)
+        export_body = (await self.setup_request("GET", "/export", params=scope)).content
+
+        # Read endpoints, against the seeded data
+        def get(url, params=None, headers=None, expected=(200,)):
+            async def step(stats, i):
+                await self.timed(stats, "GET", url, params={**scope, **(params or {})}, headers=headers, expected=expected)
+            return step
+
+        await self.scenario("list_championships", "GET", "/championships/", get("/championships/"))
+        await self.scenario("list_teams", "GET", "/teams/", get("/teams/", {"limit": 100}))
+        await self.scenario("list_teams_by_name", "GET", "/teams/?name=", get("/teams/", {"name": "team00", "limit": 100}))
+        await self.scenario("list_matches", "GET", "/matches/", get("/matches/", {"limit": 100}))
+        await self.scenario("list_matches_by_team", "GET", "/matches/?team=", get("/matches/", {"team": teams[0]["name"], "limit": 100}))
+        await self.scenario("search_teams", "GET", "/teams/search", get("/teams/search", {"q": "team00"}))
+        await self.scenario("team_matches", "GET", "/teams/{team_name}/matches", get(f"/teams/{teams[0]['name']}/matches"))
+
+        async def rankings_cold(stats, i):
+            main.snapshots.current.clear()
+            await self.timed(stats, "GET", "/rankings/", params=scope)
+        await self.scenario("rankings_cold", "GET", "/rankings/", rankings_cold)
+        await self.scenario("rankings_cached", "GET", "/rankings/", get("/rankings/"))
+        etag = (await self.setup_request("GET", "/rankings/", params=scope)).headers["etag"]
+        await self.scenario("rankings_not_modified", "GET", "/rankings/", get("/rankings/", headers={"If-None-Match": etag}, expected=(304,)))
+
+        async def projections(stats, i):
+            main.snapshots.current.clear()
+            await self.timed(stats, "GET", "/rankings/projections", params={**scope, "simulations": args.simulations})
+        await self.scenario("rankings_projections", "GET", "/rankings/projections", projections)
+        await self.scenario("events", "GET", "/events", get("/events", {"limit": 100}))
+        # Rankings right after the middle seeded match, replayed from a checkpoint
+        events = (await self.setup_request("GET", "/events", params={**scope, "limit": 1000})).json()["items"]
+        if events:
+            as_of = events[len(events) // 2]["seq"]
+            await self.scenario("rankings_as_of", "GET", "/rankings/?as_of=", get("/rankings/", {"as_of": as_of}))
+        await self.scenario("changes", "GET", "/changes", get("/changes", {"since": 0, "limit": 100}))
+        await self.scenario("log", "GET", "/log", get("/log", {"limit": 100}))
+        await self.scenario("metrics", "GET", "/metrics", get("/metrics"))
+        await self.scenario("export", "GET", "/export", get("/export"))
+
+        # Write endpoints
+        async def add_team(stats, i):
+            await self.timed(stats, "POST", "/teams/", params=scope, json=data.new_team())
+        await self.scenario("add_team", "POST", "/teams/", add_team)
+
+        async def add_teams_bulk(stats, i):
+            batch = [data.new_team() for _ in range(args.bulk_size)]
+            await self.timed(stats, "POST", "/teams/bulk", params=scope, json={"teams": batch})
+        await self.scenario("add_teams_bulk", "POST", "/teams/bulk", add_teams_bulk)
+
+        async def update_team(stats, i):
+            team = teams[i % len(teams)]
+            await self.timed(stats, "PUT", f"/teams/{team['name']}", params=scope, json={**team, "registration_date": data.random_date()})
+        await self.scenario("update_team", "PUT", "/teams/{team_name}", update_team)
+
+        # Matches need unplayed pairings, so these run only as many requests as the data has left
+        async def add_match(stats, i):
+            await self.timed(stats, "POST", "/matches/", params=scope, json=data.new_match())
+        await self.scenario("add_match", "POST", "/matches/", add_match, min(args.requests, len(data.unplayed) // 2))
+
+        async def add_matches_bulk(stats, i):
+            batch = [data.new_match() for _ in range(args.bulk_size)]
+            await self.timed(stats, "POST", "/matches/bulk", params=scope, json={"matches": batch})
+        await self.scenario("add_matches_bulk", "POST", "/matches/bulk", add_matches_bulk, min(args.requests, len(data.unplayed) // max(args.bulk_size, 1)))
+
+        async def update_match(stats, i):
+            match = matches[i % len(matches)]
+            await self.timed(stats, "PUT", f"/matches/{match['id']}", params=scope, json=data.random_match(match["team_a"], match["team_b"]))
+        if matches:
+            await self.scenario("update_match", "PUT", "/matches/{match_id}", update_match)
+
+        # Championship lifecycle, each on a championship of its own
+        async def add_championship(stats, i):
+            await self.timed(stats, "POST", "/championships/", json={"name": f"Benchmark {i}", "group_count": args.groups})
+        await self.scenario("add_championship", "POST", "/championships/", add_championship)
+
+        scratch = SyntheticChampionship(min(args.teams, 12), 2, 10, args.seed)
+
+        async def archive_championship(stats, i):
+            created = await self.create_championship(f"Archive {i}", scratch, matches=False)
+            await self.timed(stats, "POST", f"/championships/{created['id']}/archive")
+        await self.scenario("archive_championship", "POST", "/championships/{championship_id}/archive", archive_championship)
+
+        async def clear(stats, i):
+            created = await self.create_championship(f"Clear {i}", scratch)
+            await self.timed(stats, "DELETE", "/clear/", params={"championship_id": created["id"]})
+        await self.scenario("clear", "DELETE", "/clear/", clear)
+
+        # Each import loads the seeded championship, as exported before the writes, into an empty one
+        async def import_championship(stats, i):
+            created = (await self.setup_request("POST", "/championships/", json={
+                "name": f"Import {i}", "group_count": data.groups, "group_capacity": max(data.group_capacity(0), 2),
+            })).json()
+            await self.timed(stats, "POST", "/import", params={"championship_id": created["id"]}, content=export_body)
+        await self.scenario("import", "POST", "/import", import_championship)
+
+        return {"seed_seconds": round(setup_seconds, 3), "seeded_teams": len(teams), "seeded_matches": len(matches)}
+
+async def run_benchmark(args, main, database):
+    import httpx
+    from sqlalchemy import event
+
+    for sync_engine in (database.engine, database.async_engine.sync_engine):
+        event.listen(sync_engine, "before_cursor_execute", count_statement)
+
+    # /rankings/stream is not benchmarked: the in-process transport only returns once a response
+    # body ends, and the stream never does
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        benchmark = Benchmark(client, args)
+        setup = await benchmark.run(main)
+    return setup, benchmark.results
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # The backend reads its configuration at import time, so point it at a throwaway directory first
+    workdir = tempfile.mkdtemp(prefix="championship-benchmark-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'benchmark.db')}"
+    os.environ["ASYNC_DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(workdir, 'benchmark.db')}"
+    os.environ["AUDIT_LOG_DIR"] = workdir
+    os.environ["STORAGE_BACKEND"] = args.storage
+
+    from backend import main as backend_main, database, audit
+
+    try:
+        setup, endpoints = asyncio.run(run_benchmark(args, backend_main, database))
+    finally:
+        # Flush the audit log before its directory goes away
+        audit.listener.stop()
+        atexit.unregister(audit.listener.stop)
+        if args.keep_db:
+            print(f"Database kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "keep_db")},
+        "environment": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+        },
+        "setup": setup,
+        "endpoints": endpoints,
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,66 +1,218 @@
 import streamlit as st
 import requests
 import pandas as pd
+import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from urllib.parse import quote
+from requests.adapters import HTTPAdapter
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 # Set your FastAPI backend URL
 API_URL = "http://host.docker.internal:8000"
 
+# Seconds before a request to the backend gives up
+REQUEST_TIMEOUT = 30
+# Seconds fetched data stays cached; the app's own writes clear the cache right away
+CACHE_TTL_SECONDS = 30
+# Simulations behind the qualification chances on the scoreboard
+PROJECTION_SIMULATIONS = 5000
+
 # Configure the page layout and theme
 st.set_page_config(page_title="Football Championship", layout="wide", page_icon="⚽")
 
+# One pooled HTTP session shared by every rerun and browser tab, so requests reuse open connections
+@st.cache_resource
+def get_http():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+http = get_http()
+
+# Cached GET of a JSON endpoint; failures raise and are not cached
+@st.cache_data(ttl=CACHE_TTL_SECONDS, show_spinner=False)
+def get_json(path, params=None):
+    response = http.get(f"{API_URL}{path}", params=params, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+# Cached GET of every page of a list endpoint (/teams/ or /matches/)
+@st.cache_data(ttl=CACHE_TTL_SECONDS, show_spinner=False)
+def get_items(path, params):
+    items, after_id = [], 0
+    while after_id is not None:
+        response = http.get(f"{API_URL}{path}", params={**params, "after_id": after_id, "limit": 1000}, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        page = response.json()
+        items.extend(page["items"])
+        after_id = page["next_after_id"]
+    return items
+
+# Drop every cached read, so the next rerun shows the data this app just changed
+def invalidate_cache():
+    get_json.clear()
+    get_items.clear()
+
+# Send a write to the backend, clearing the cached reads once it succeeds
+def send(method, path, **kwargs):
+    response = http.request(method, f"{API_URL}{path}", timeout=REQUEST_TIMEOUT, **kwargs)
+    if response.status_code == 200:
+        invalidate_cache()
+    return response
+
+# Show why a fetch failed
+def show_fetch_error(what, e):
+    if isinstance(e, requests.exceptions.HTTPError):
+        st.error(f"Failed to fetch {what} from backend.")
+        st.write(e.response.text)
+    else:
+        st.error("Error connecting to the API.")
+        st.write(e)
+
+# Run independent fetches at the same time. Each call is (function, *args); the results come back
+# in order, with a failed call's exception in place of its result.
+def fetch_concurrently(*calls):
+    ctx = get_script_run_ctx()
+
+    def run(call):
+        add_script_run_ctx(ctx=ctx)  # lets cached functions and session state work in the worker thread
+        function, *args = call
+        try:
+            return function(*args)
+        except requests.exceptions.RequestException as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=len(calls)) as pool:
+        return list(pool.map(run, calls))
+
 # Sidebar Main Navigation
 st.sidebar.title("🏆 Football Championship")
-main_page = st.sidebar.selectbox("Main Menu", ["Scoreboard", "Teams", "Matches", "Data Change Log", "Clear All Data"])
+main_page = st.sidebar.selectbox("Main Menu", ["Scoreboard", "Teams", "Matches", "Championships", "Data Change Log", "Clear All Data"])
 
-# Utility function to fetch rankings and teams data from backend
-def fetch_rankings():
+# Utility function to fetch the championships from backend
+def fetch_championships():
     try:
-        response = requests.get(f"{API_URL}/rankings/")
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error("Failed to fetch rankings data from backend.")
-            st.write(response.text)
-            return {}
+        return get_json("/championships/")
     except requests.exceptions.RequestException as e:
-        st.error("Error connecting to the API.")
-        st.write(e)
-        return {}
+        show_fetch_error("championships", e)
+    return []
+
+# Every request is scoped to the championship selected in the sidebar
+championships = fetch_championships()
+championship = st.sidebar.selectbox(
+    "Championship", championships,
+    format_func=lambda c: f"{c['name']} (archived)" if c["archived"] else c["name"]
+)
+scope = {"championship_id": championship["id"]} if championship else {}
+group_count = championship["group_count"] if championship else 2
+
+# Fetch rankings data from backend. The last payload is kept per session and revalidated with its ETag,
+# so unchanged data is not re-downloaded. The scoreboard only needs the rankings and top 4 lists.
+def load_rankings():
+    cached = st.session_state.get("rankings_cache")
+    headers = {"If-None-Match": cached["etag"]} if cached else {}
+    params = {**scope, "include": "rankings,top_4"}
+    response = http.get(f"{API_URL}/rankings/", params=params, headers=headers, timeout=REQUEST_TIMEOUT)
+    if response.status_code == 304 and cached:
+        return cached["data"]
+    response.raise_for_status()
+    data = response.json()
+    etag = response.headers.get("ETag")
+    if etag:
+        st.session_state.rankings_cache = {"etag": etag, "data": data}
+    return data
+
+# Cached like get_json, with `version` as part of the cache key only; the backend does not take it
+@st.cache_data(ttl=CACHE_TTL_SECONDS, show_spinner=False)
+def get_projections(params, version):
+    response = http.get(f"{API_URL}/rankings/projections", params=params, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+# Fetch each team's chance of finishing in its group's top 4; `version` keys the cache to a data version
+def load_projections(version=None):
+    return get_projections({**scope, "simulations": PROJECTION_SIMULATIONS}, version)
+
+# Fetch a single JSON response scoped to the selected championship
+def fetch_json(path, params=None):
+    try:
+        return get_json(path, {**scope, **(params or {})})
+    except requests.exceptions.RequestException as e:
+        show_fetch_error(f"{path} data", e)
+        return None
 
-# Scoreboard Page
-if main_page == "Scoreboard":
-    st.title("🏆 Football Championship Scoreboard")
-    rankings_data = fetch_rankings()
-
-    if rankings_data and "rankings" in rankings_data:
-        # Split teams by group
-        group_1 = [team for team in rankings_data["rankings"] if team.get("group_number", 0) == 1]
-        group_2 = [team for team in rankings_data["rankings"] if team.get("group_number", 0) == 2]
-
-        top_4_group_1 = [team["team_name"] for team in rankings_data.get("top_4_group_1", [])]
-        top_4_group_2 = [team["team_name"] for team in rankings_data.get("top_4_group_2", [])]
-
-        # Display Group 1 Rankings
-        st.subheader("⚽ Group 1 Rankings")
-        df_group_1 = pd.DataFrame(group_1)
-        if not df_group_1.empty:
-            df_group_1 = df_group_1[["team_name", "match_points", "goals_scored", "alternate_points", "registration_date"]]
-            df_group_1['qualified'] = df_group_1['team_name'].apply(lambda x: "✅" if x in top_4_group_1 else "")
-            st.dataframe(df_group_1.style.hide(axis="index").set_table_styles([
-                {'selector': 'thead th', 'props': [('font-weight', 'bold')]}
-            ]), hide_index=True)
+# Teams whose name contains the search term, from the backend's name index
+def search_teams(search_term, limit=100):
+    return fetch_json("/teams/search", {"q": search_term, "limit": limit})
 
-        # Display Group 2 Rankings
-        st.subheader("⚽ Group 2 Rankings")
-        df_group_2 = pd.DataFrame(group_2)
-        if not df_group_2.empty:
-            df_group_2 = df_group_2[["team_name", "match_points", "goals_scored", "alternate_points", "registration_date"]]
-            df_group_2['qualified'] = df_group_2['team_name'].apply(lambda x: "✅" if x in top_4_group_2 else "")
-            st.dataframe(df_group_2.style.hide(axis="index").set_table_styles([
+# Utility function to fetch every page of a list endpoint (/teams/ or /matches/) from backend
+def fetch_items(path, params=None):
+    try:
+        return get_items(path, {**scope, **(params or {})})
+    except requests.exceptions.RequestException as e:
+        show_fetch_error(f"{path} data", e)
+        return None
+
+# Draw every group's rankings table, with each team's top 4 chance when projections are available
+def render_scoreboard(rankings_data, projections=None):
+    chances = {}
+    for group in (projections or {}).get("groups", []):
+        for team in group["teams"]:
+            chances[team["team_name"]] = f"{team['top_4_probability']:.0%}"
+
+    for group_number in range(1, group_count + 1):
+        group = [team for team in rankings_data["rankings"] if team.get("group_number", 0) == group_number]
+        top_4 = [team["team_name"] for team in rankings_data.get(f"top_4_group_{group_number}", [])]
+
+        # Display the group's rankings
+        st.subheader(f"⚽ Group {group_number} Rankings")
+        df_group = pd.DataFrame(group)
+        if not df_group.empty:
+            df_group = df_group[["team_name", "match_points", "goals_scored", "alternate_points", "registration_date"]]
+            df_group['qualified'] = df_group['team_name'].apply(lambda x: "✅" if x in top_4 else "")
+            if chances:
+                df_group['top_4_chance'] = df_group['team_name'].map(chances).fillna("")
+            st.dataframe(df_group.style.hide(axis="index").set_table_styles([
                 {'selector': 'thead th', 'props': [('font-weight', 'bold')]}
             ]), hide_index=True)
 
+# Scoreboard Page
+if main_page == "Scoreboard":
+    st.title("🏆 Football Championship Scoreboard")
+    live = st.toggle("🔴 Live updates", value=True)
+    scoreboard = st.empty()
+
+    if live:
+        # The backend pushes the current standings, then a new snapshot after every change.
+        # Streamlit stops this loop as soon as the user interacts with the page.
+        try:
+            with http.get(f"{API_URL}/rankings/stream", params=scope, stream=True, timeout=(5, None)) as response:
+                version = None
+                for line in response.iter_lines(decode_unicode=True):
+                    if line and line.startswith("id:"):
+                        version = line[len("id:"):].strip()
+                    elif line and line.startswith("data:"):
+                        try:
+                            projections = load_projections(version)
+                        except requests.exceptions.RequestException:
+                            projections = None  # the standings still update without the chances
+                        with scoreboard.container():
+                            render_scoreboard(json.loads(line[len("data:"):]), projections)
+        except requests.exceptions.RequestException as e:
+            st.warning("Live updates disconnected. Refresh the page to reconnect.")
+            st.write(e)
+    else:
+        # Rankings and qualification chances are independent, so fetch them together
+        rankings_data, projections = fetch_concurrently((load_rankings,), (load_projections,))
+        if isinstance(rankings_data, Exception):
+            show_fetch_error("rankings data", rankings_data)
+        elif "rankings" in rankings_data:
+            with scoreboard.container():
+                render_scoreboard(rankings_data, None if isinstance(projections, Exception) else projections)
+
 
 # Teams Sub-menu
 elif main_page == "Teams":
@@ -75,24 +227,32 @@ elif main_page == "Teams":
 
         if st.button("Add Teams"):
             teams = team_input.split('\n')
+            batch = []
             for team in teams:
                 team_data = team.split()
                 if len(team_data) == 3:
                     team_name, registration_date, group_number = team_data
-                    data = {
+                    batch.append({
                         "name": team_name,
                         "registration_date": registration_date,
                         "group_number": int(group_number)
-                    }
-                    # Send request to the backend
-                    response = requests.post(f"{API_URL}/teams/", json=data)
-                    if response.status_code == 200:
-                        st.success(f"✅ Team Added: {team_name}")
-                    else:
-                        st.error(f"❌ Failed to add Team: {response.json()['detail']}")
+                    })
                 else:
                     st.error(f"⚠ Invalid format for line: {team}")
 
+            # Send the valid lines to the backend in one request, keeping the rows it accepts
+            if batch:
+                response = send("POST", "/teams/bulk", params=scope, json={"teams": batch, "atomic": False})
+                if response.status_code == 200:
+                    for result in response.json()["results"]:
+                        team_name = batch[result["index"]]["name"]
+                        if result["accepted"]:
+                            st.success(f"✅ Team Added: {team_name}")
+                        else:
+                            st.error(f"❌ Failed to add Team {team_name}: {result['detail']}")
+                else:
+                    st.error(f"❌ Failed to add Teams: {response.text}")
+
     # Edit Teams Page
     elif team_option == "Edit Teams":
         st.title("⚽ Edit Teams")
@@ -101,19 +261,19 @@ elif main_page == "Teams":
             st.session_state.reload_teams = 0
 
         reload_key = f"reload_{st.session_state.get('reload_teams', 0)}"
-        rankings_data = fetch_rankings()
+        teams = fetch_items("/teams/", {"fields": "name,registration_date,group_number"})
 
-        if "rankings" in rankings_data:
-            df_teams = pd.DataFrame(rankings_data["rankings"])
+        if teams is not None:
+            df_teams = pd.DataFrame(teams)
 
             # Select a team to edit
-            selected_team = st.selectbox("Select a team to edit", df_teams["team_name"].tolist() if not df_teams.empty else [], key=f"select_{reload_key}")
+            selected_team = st.selectbox("Select a team to edit", df_teams["name"].tolist() if not df_teams.empty else [], key=f"select_{reload_key}")
 
             if selected_team:
-                selected_team_data = df_teams[df_teams["team_name"] == selected_team].iloc[0]
+                selected_team_data = df_teams[df_teams["name"] == selected_team].iloc[0]
                 
                 # Display fields for editing
-                new_team_name = st.text_input("New Team Name", value=selected_team_data["team_name"], key=f"name_{reload_key}")
+                new_team_name = st.text_input("New Team Name", value=selected_team_data["name"], key=f"name_{reload_key}")
                 new_registration_date = st.text_input("New Registration Date (DD/MM)", value=selected_team_data["registration_date"], key=f"date_{reload_key}")
 
                 # Validate registration date
@@ -124,7 +284,7 @@ elif main_page == "Teams":
                     valid_date = False
                     st.error("⚠ Invalid date format. Please use DD/MM format.")
                 
-                new_group_number = st.number_input("New Group Number", min_value=1, max_value=2, value=int(selected_team_data["group_number"]), key=f"group_{reload_key}")
+                new_group_number = st.number_input("New Group Number", min_value=1, max_value=group_count, value=int(selected_team_data["group_number"]), key=f"group_{reload_key}")
                 
                 # Update team (only if the date is valid)
                 if st.button("Update Team", key=f"update_{reload_key}") and valid_date:
@@ -133,7 +293,7 @@ elif main_page == "Teams":
                         "registration_date": new_registration_date,
                         "group_number": new_group_number
                     }
-                    response = requests.put(f"{API_URL}/teams/{selected_team}", json=update_data)
+                    response = send("PUT", f"/teams/{selected_team}", params=scope, json=update_data)
                     if response.status_code == 200:
                         st.success(f"✅ Team Updated: {selected_team}")
                         st.session_state.reload_teams += 1
@@ -144,14 +304,14 @@ elif main_page == "Teams":
     elif team_option == "View Teams":
         st.title("⚽ View Teams")
 
-        rankings_data = fetch_rankings()
-        if "rankings" in rankings_data:
-            df_teams = pd.DataFrame(rankings_data["rankings"])
-
-            # Search for specific teams
-            search_term = st.text_input("🔍 Search for a team:")
-            if search_term:
-                df_teams = df_teams[df_teams["team_name"].str.contains(search_term, case=False)]
+        # Search for specific teams (matched by the backend's name index)
+        search_term = st.text_input("🔍 Search for a team:")
+        if search_term:
+            teams = search_teams(search_term)
+        else:
+            teams = fetch_items("/teams/", {"fields": "name,registration_date,group_number"})
+        if teams is not None:
+            df_teams = pd.DataFrame(teams).drop(columns=["id", "championship_id"], errors="ignore")
 
             # Display the teams table
             if not df_teams.empty:
@@ -172,6 +332,7 @@ elif main_page == "Matches":
 
         if st.button("Add Matches"):
             matches = match_input.split('\n')
+            batch = []
             for match in matches:
                 match_data = match.split()
                 if len(match_data) == 4:
@@ -187,32 +348,39 @@ elif main_page == "Matches":
                         elif team_a == team_b:
                             st.error("⚠ Team A and Team B must be different.")
                         else:
-                            data = {
+                            batch.append({
                                 "team_a": team_a,
                                 "team_b": team_b,
                                 "goals_a": goals_a,
                                 "goals_b": goals_b
-                            }
-                            # Send request to the backend
-                            response = requests.post(f"{API_URL}/matches/", json=data)
-                            if response.status_code == 200:
-                                st.success(f"✅ Match Added: {team_a} vs {team_b}")
-                            else:
-                                st.error(f"❌ Failed to add Match: {response.json()['detail']}")
+                            })
                     except ValueError:
                         st.error(f"⚠ Invalid input: Goals must be integers. Please correct the input format for the match: {match}")
                 else:
                     st.error(f"⚠ Invalid format for line: {match}. Correct format is: <Team A Name> <Team B Name> <Goals A> <Goals B>")
 
+            # Send the valid lines to the backend in one request, keeping the rows it accepts
+            if batch:
+                response = send("POST", "/matches/bulk", params=scope, json={"matches": batch, "atomic": False})
+                if response.status_code == 200:
+                    for result in response.json()["results"]:
+                        data = batch[result["index"]]
+                        if result["accepted"]:
+                            st.success(f"✅ Match Added: {data['team_a']} vs {data['team_b']}")
+                        else:
+                            st.error(f"❌ Failed to add Match: {result['detail']}")
+                else:
+                    st.error(f"❌ Failed to add Matches: {response.text}")
+
 
 
     # Edit Matches Page
     elif match_option == "Edit Matches":
         st.title("⚽ Edit Matches")
-        rankings_data = fetch_rankings()
+        matches = fetch_items("/matches/")
 
-        if "matches" in rankings_data and rankings_data["matches"]:
-            df_matches = pd.DataFrame(rankings_data["matches"])
+        if matches:
+            df_matches = pd.DataFrame(matches)
 
             if 'id' in df_matches.columns:
                 # Select a match to edit
@@ -239,7 +407,7 @@ elif main_page == "Matches":
                             "goals_a": new_goals_a,
                             "goals_b": new_goals_b
                         }
-                        response = requests.put(f"{API_URL}/matches/{selected_match_id}", json=update_data)
+                        response = send("PUT", f"/matches/{selected_match_id}", params=scope, json=update_data)
                         if response.status_code == 200:
                             st.success(f"✅ Match Updated: {selected_match_data['team_a']} vs {selected_match_data['team_b']}")
                         else:
@@ -252,42 +420,113 @@ elif main_page == "Matches":
     # View Matches Page
     elif match_option == "View Matches":
         st.title("⚽ View Matches")
-        rankings_data = fetch_rankings()
 
-        if "matches" in rankings_data:
-            df_matches = pd.DataFrame(rankings_data["matches"])
+        # Search for a team, then show only that team's matches
+        search_term = st.text_input("🔍 Search for a match by team name:")
+        if search_term:
+            teams = search_teams(search_term)
+            team_name = st.selectbox("Team", [team["name"] for team in teams]) if teams else None
+            if teams == []:
+                st.info("No team matches the search.")
+            matches = fetch_json(f"/teams/{quote(team_name, safe='')}/matches") if team_name else None
+        else:
+            matches = fetch_items("/matches/")
 
-            search_term = st.text_input("🔍 Search for a match by team name:")
-            if search_term:
-                df_matches = df_matches[df_matches.apply(lambda row: search_term.lower() in row["team_a"].lower() or search_term.lower() in row["team_b"].lower(), axis=1)]
+        if matches is not None:
+            df_matches = pd.DataFrame(matches)
 
             if not df_matches.empty:
+                df_matches = df_matches.drop(columns="championship_id", errors="ignore")
                 st.dataframe(df_matches.style.hide(axis="index").set_table_styles([
                     {'selector': 'thead th', 'props': [('font-weight', 'bold')]}
                 ]), hide_index=True)
 
+# Championships Page
+elif main_page == "Championships":
+    st.title("🏆 Championships")
+
+    if championships:
+        df_championships = pd.DataFrame(championships)[["id", "name", "group_count", "group_capacity", "archived"]]
+        st.dataframe(df_championships, hide_index=True)
+
+    # Start a new championship with its own group settings
+    st.subheader("Start a New Championship")
+    new_name = st.text_input("Championship Name")
+    new_group_count = st.number_input("Number of Groups", min_value=1, value=2)
+    new_group_capacity = st.number_input("Teams per Group", min_value=2, value=6)
+    if st.button("Create Championship") and new_name:
+        response = send("POST", "/championships/", json={
+            "name": new_name,
+            "group_count": new_group_count,
+            "group_capacity": new_group_capacity
+        })
+        if response.status_code == 200:
+            st.success(f"✅ Championship Created: {new_name}")
+        else:
+            st.error(f"❌ Failed to create Championship: {response.json()['detail']}")
+
+    # Archive the selected championship, keeping its data readable
+    if championship and not championship["archived"]:
+        st.subheader("Archive Championship")
+        st.info(f"Archiving keeps {championship['name']} viewable but stops any further changes.")
+        if st.button(f"Archive {championship['name']}"):
+            response = send("POST", f"/championships/{championship['id']}/archive")
+            if response.status_code == 200:
+                st.success(f"✅ Championship Archived: {championship['name']}")
+            else:
+                st.error(f"❌ Failed to archive Championship: {response.json()['detail']}")
+
 # Data Change Log Page
 elif main_page == "Data Change Log":
     st.title("📝 Data Change Log")
-    
+
+    # Page through the log from the backend; None shows the latest entries
+    page_size = 100
+    if "log_after_seq" not in st.session_state:
+        st.session_state.log_after_seq = None
+
     try:
-        with open("data_change_log.txt", "r") as f:
-            log_data = f.read()
-            if log_data:
-                st.text_area("📝 Data Change Log", log_data, height=400)
+        params = {"limit": page_size}
+        if st.session_state.log_after_seq is not None:
+            params["after_seq"] = st.session_state.log_after_seq
+        response = http.get(f"{API_URL}/log", params=params, timeout=REQUEST_TIMEOUT)
+        if response.status_code == 200:
+            log_page = response.json()
+            entries = log_page["entries"]
+            if entries:
+                df_log = pd.DataFrame(entries)[["seq", "timestamp", "championship", "action", "item_type", "item_name", "details"]]
+                st.dataframe(df_log, hide_index=True)
             else:
                 st.info("No data changes logged yet.")
-    except FileNotFoundError:
-        st.error("Log file not found.")
+
+            first_seq = entries[0]["seq"] if entries else log_page["last_seq"] + 1
+            col_older, col_newer, col_latest = st.columns(3)
+            if col_older.button("⬅ Older", disabled=first_seq <= 1):
+                st.session_state.log_after_seq = max(first_seq - 1 - page_size, 0)
+                st.rerun()
+            if col_newer.button("Newer ➡", disabled=log_page["next_after_seq"] >= log_page["last_seq"]):
+                st.session_state.log_after_seq = log_page["next_after_seq"]
+                st.rerun()
+            if col_latest.button("Latest"):
+                st.session_state.log_after_seq = None
+                st.rerun()
+        else:
+            st.error("Failed to fetch the data change log from backend.")
+    except requests.exceptions.RequestException as e:
+        st.error("Error connecting to the API.")
+        st.write(e)
 
 # Clear All Data Page
 elif main_page == "Clear All Data":
     st.title("⚠ Clear All Data")
-    st.warning("This will delete all teams and matches from the database. This action cannot be undone.")
+    st.warning("This will delete all teams and matches of the selected championship from the database. This action cannot be undone.")
 
+    archive = st.checkbox("Archive the championship's teams and matches before clearing", value=True)
     if st.button("Clear All Data"):
-        response = requests.delete(f"{API_URL}/clear/")
+        response = send("DELETE", "/clear/", params={**scope, "archive": archive})
         if response.status_code == 200:
             st.success("✅ All data cleared from the database.")
+            if response.json().get("archive"):
+                st.info(f"Archived to {response.json()['archive']}")
         else:
             st.error("❌ Failed to clear the database.")